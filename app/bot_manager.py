@@ -1,6 +1,6 @@
-from utils.logger import Logger, PrintHandler, ErrorHandler
-from utils.ujson import JsonManager
-from utils.smartdisnake import SmartBot
+from app.utils.logger import Logger, PrintHandler, ErrorHandler
+from app.utils.ujson import JsonRegistry
+from app.utils.smartdisnake import SmartBot
 from dotenv import dotenv_values
 from disnake import Intents
 import sys
@@ -18,10 +18,8 @@ class BotManager:
             sys.stdout = PrintHandler(self.log)
 
         # load json files
-        self.bot_properties = JsonManager("bot_properties.json")
-        self.factory_jsm = JsonManager("factory.json")
-        self.bot_properties.load_from_file()
-        self.factory_jsm.load_from_file()
+        self.bot_properties = JsonRegistry.get("bot_properties.json")
+        self.factory_jsm = JsonRegistry.get("factory.json")
         self.__env_val = dotenv_values(self.factory_jsm[".env"])
 
         self.log.printf(self.factory_jsm["init_bm"])
@@ -44,5 +42,6 @@ class BotManager:
         self.log.printf(self.factory_jsm["st_bot"])
         self.bot.run(token)
         print("гооооооооол")
+        self.log.close()
 
     #def stop_bot
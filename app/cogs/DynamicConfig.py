@@ -1,10 +1,27 @@
-from typing import Any, List, Dict, Callable
-from disnake import ApplicationCommandInteraction, Role, Interaction
+from typing import Any, Dict, Callable, Tuple, Iterable
+from disnake import ApplicationCommandInteraction, Interaction
 from app.utils.logger import LogType
 from disnake.ext import commands
-from app.utils.ujson import JsonManager, AddressType
+from app.utils.ujson import JsonRegistry, JsonManager
 from app.utils.smartdisnake import SmartBot
 from functools import wraps as wrapper_func
+from time import monotonic
+import asyncio
+
+
+# seconds between the changing value and writing config to file
+SAVE_DELAY = 2.0
+# seconds while the result of the role checking for the member is reused
+ROLE_CHECK_TTL = 5.0
+# count of remembered results, after it the expired results are deleted
+ROLE_CHECK_MEMO_SIZE = 1024
+
+
+class RoleCheckMode:
+    # member must have at least one of the roles
+    ANY = "any"
+    # member must have every role
+    ALL = "all"
 
 
 # subclass for the Dynamic Config Shape
@@ -60,12 +77,156 @@ class ValueConvertor:
         return int(ds_id)
 
 
+class DynamicValues:
+    def __init__(self, dynamic_json: JsonManager, bot: SmartBot, save_delay: float = SAVE_DELAY):
+        """
+        Typed in-memory map of dynamic config values with per-key versions
+
+        Changing of the value updates only this key in bot.props,
+        writing to file is delayed and groups all changes made during save_delay
+
+        Args:
+            dynamic_json: manager of the dynamic config file
+            bot: bot which props will be updated
+            save_delay: seconds between the changing value and writing config to file
+        """
+        self._json = dynamic_json
+        self._bot = bot
+        self.save_delay = save_delay
+        self.values: Dict[str, Any] = {}
+        self.types: Dict[str, str] = {}
+        self.versions: Dict[str, int] = {}
+        # version of the whole config, it is changed with every key
+        self.version = 0
+        self._save_handle: asyncio.TimerHandle | None = None
+        self._dirty = False
+        # role tags > frozenset of role ids, it is cleared by every change of values
+        self._role_sets: Dict[Tuple[str, ...], frozenset] = {}
+        # (guild id, member id, role tags, mode) > (version, expire time, result)
+        self._role_checks: Dict[Tuple[int | None, int, Tuple[str, ...], str], Tuple[int, float, bool]] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """Rebuild all values from the buffer of the dynamic config file"""
+        for key, data in self._json.items():
+            self.values[key] = data.get("value")
+            self.types[key] = data.get("type")
+            self.versions[key] = self.versions.get(key, 0) + 1
+        for key in set(self.values).difference(self._json.keys()):
+            del self.values[key], self.types[key], self.versions[key]
+        self.version += 1
+        self._role_sets.clear()
+        self.inject_into_props()
+
+    def inject_into_props(self) -> None:
+        """Put values to the runtime-only section of bot.props, it is lost when props are read from file"""
+        self._bot.props["dynamic_config"] = self.values.copy()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+    def keys(self):
+        return self.values.keys()
+
+    def items(self):
+        return self.values.items()
+
+    def set(self, key: str, value: Any) -> None:
+        """Change one value and plan writing to file"""
+        self.values[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+        self.version += 1
+        self._role_sets.clear()
+        self._json[f"{key}/value"] = value
+        self._bot.props[f"dynamic_config/{key}"] = value
+        self.schedule_save()
+
+    def role_ids(self, role_tags: Tuple[str, ...]) -> frozenset:
+        """Ids of roles which are set in the dynamic vars role_tags"""
+        role_ids = self._role_sets.get(role_tags)
+        if role_ids is None:
+            role_ids = frozenset(self.values.get(tag) for tag in role_tags)
+            self._role_sets[role_tags] = role_ids
+        return role_ids
+
+    def check_roles(self, guild_id: int | None, member_id: int, member_role_ids: Callable[[], Iterable[int]],
+                    role_tags: Tuple[str, ...], mode: str = RoleCheckMode.ALL) -> bool:
+        """
+        Check member roles, the result is reused for ROLE_CHECK_TTL seconds while values are not changed
+
+        Args:
+            guild_id: id of the guild, roles of the same user are different in every guild
+            member_id: id of the member
+            member_role_ids: function which returns ids of the member roles, it is called only without memo
+            role_tags: dyn vars names with roles
+            mode: use class RoleCheckMode for setting this parameter
+        """
+        key = (guild_id, member_id, role_tags, mode)
+        now = monotonic()
+        memo = self._role_checks.get(key)
+        if memo is not None and memo[0] == self.version and memo[1] > now:
+            return memo[2]
+
+        role_ids = self.role_ids(role_tags)
+        member_roles = frozenset(member_role_ids())
+        if mode == RoleCheckMode.ANY:
+            result = not role_ids.isdisjoint(member_roles)
+        else:
+            result = role_ids.issubset(member_roles)
+
+        if len(self._role_checks) >= ROLE_CHECK_MEMO_SIZE:
+            self._role_checks = {k: v for k, v in self._role_checks.items()
+                                 if v[0] == self.version and v[1] > now}
+        self._role_checks[key] = (self.version, now + ROLE_CHECK_TTL, result)
+        return result
+
+    def schedule_save(self) -> None:
+        self._dirty = True
+        if self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop, so write at once
+            self.save()
+            return
+        self._save_handle = loop.call_later(self.save_delay, self.save)
+
+    def save(self) -> None:
+        """Write config to file if it was changed"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._dirty:
+            self._dirty = False
+            self._json.write_in_file()
+
+
 class DynamicConfigCog(commands.Cog):
     def __init__(self, bot: SmartBot):
         self.bot = bot
         file_name = bot.props["dynamic_config_file_name"]
-        self.dynamic_json = JsonManager(file_name)
-        self.dynamic_json.load_from_file()
+        self.dynamic_json = JsonRegistry.get(file_name)
+        self.dynamic_values = DynamicValues(self.dynamic_json, bot)
+        bot.dynamic_config = self.dynamic_values
+        # choices of the commands are built from these keys
+        self._keys = tuple(self.dynamic_json.keys())
+        bot.watcher.watch(self.dynamic_json, self._on_file_reload)
+
+    def cog_unload(self) -> None:
+        self.bot.watcher.unwatch_callback(self.dynamic_json, self._on_file_reload)
+        # write changes which are waiting for the saving
+        self.dynamic_values.save()
+
+    def _on_file_reload(self, dynamic_json: JsonManager) -> None:
+        self.dynamic_values.reload()
+        if tuple(dynamic_json.keys()) != self._keys:
+            # build cog again with new choices, disnake syncs changed commands itself
+            self.bot.log.info("Keys of dynamic config are changed, reloading %s", self.__module__)
+            self.bot.reload_extension(self.__module__)
 
     @staticmethod
     def is_cfg_setup(*params: str, echo: bool = True, discord_response: bool = False):
@@ -81,8 +242,11 @@ class DynamicConfigCog(commands.Cog):
             @wrapper_func(function)
             async def wrapper(self, *args, **kwargs):
                 output = ""
+                dynamic_config = self.bot.dynamic_config
                 for par in params:
-                    if self.bot.props[f"dynamic_config/{par}"] is None:
+                    value = (dynamic_config.get(par) if dynamic_config is not None
+                             else self.bot.props[f"dynamic_config/{par}"])
+                    if value is None:
                         output = par
                         break
                 if not output:
@@ -97,7 +261,7 @@ class DynamicConfigCog(commands.Cog):
                         if len(args) > 0:
                             inter = args[0]
                     if inter is None or not issubclass(type(inter), Interaction):
-                        print("Ошибка отработки is_cfg_setup")
+                        self.bot.log.debug("Ошибка отработки is_cfg_setup")
                         return
                     await inter.response.send_message(output)
                 return
@@ -105,25 +269,32 @@ class DynamicConfigCog(commands.Cog):
         return decorator
 
     @staticmethod
-    def has_any_roles(*role_tags: str, discord_response: bool = True):
+    def has_any_roles(*role_tags: str, discord_response: bool = True, mode: str = RoleCheckMode.ALL):
         """
         check roles exist by dyn vars
 
         Args:
             *role_tags: dyn vars name
             discord_response: chat logging to user
+            mode: use class RoleCheckMode for setting this parameter
 
         """
         def decorator(func: Callable):
             @wrapper_func(func)
             async def wrapper(self, *args, **kwargs) -> Any:
-                role_ids = [self.bot.props[f"dynamic_config/{role_tag}"] for role_tag in role_tags]
                 inter: ApplicationCommandInteraction = kwargs["inter"]
-                member_roles: List[Role] = inter.author.roles
-                member_role_ids = [role.id for role in member_roles]
-                for role_id in role_ids:
-                    if role_id in member_role_ids:
-                        continue
+                author = inter.author
+                dynamic_config = self.bot.dynamic_config
+                if dynamic_config is not None:
+                    allowed = dynamic_config.check_roles(inter.guild_id, author.id,
+                                                         lambda: (role.id for role in author.roles),
+                                                         role_tags, mode)
+                else:
+                    role_ids = {self.bot.props[f"dynamic_config/{role_tag}"] for role_tag in role_tags}
+                    member_role_ids = {role.id for role in author.roles}
+                    allowed = (not role_ids.isdisjoint(member_role_ids) if mode == RoleCheckMode.ANY
+                               else role_ids.issubset(member_role_ids))
+                if not allowed:
                     if discord_response:
                         await inter.response.send_message(self.bot.props["def_phrases/PermErrorDynConfig"])
                     else:
@@ -134,25 +305,12 @@ class DynamicConfigCog(commands.Cog):
             return wrapper
         return decorator
 
-    # load config from file
-    def _load_dynamic_config(self) -> Dict[str, Any]:
-        dyn_buffer = self.dynamic_json.buffer
-        dynamic_config = {}
-        for key in dyn_buffer.keys():
-            dynamic_config[key] = self.dynamic_json[f"{key}/value"]
-        return dynamic_config.copy()
-
-    # reload values
-    def _reload_dynamic_config(self):
-        self.dynamic_json.write_in_file()
-        self.bot.props["dynamic_config"] = self._load_dynamic_config()
-
     def _gen_value_table(self) -> str:
         """
         Generate beautiful table for printing
 
         """
-        dynamic_config = self._load_dynamic_config()
+        dynamic_config = self.dynamic_values.values
         len_key_column = max(map(len, dynamic_config.keys()))
         len_value_column = max(map(lambda v: len(str(v)), dynamic_config.values()))
         line_format = "{:<%i} {:<%i}" % (len_key_column + 5, len_value_column + 5)
@@ -168,23 +326,21 @@ class DynamicConfigCog(commands.Cog):
 
         """
 
-        data_type_need = self.dynamic_json[f"{parameter}/type"]
+        data_type_need = self.dynamic_values.types.get(parameter)
         convert_value = ValueConvertor(data_type_need, value).convert_value
 
         if convert_value is None:
             await inter.response.send_message(
-                self.bot.props["def_phrases/FormatErrorDynConfig"]
-            .format(value=value, data_type_need=data_type_need)
+                self.bot.phrase("def_phrases/FormatErrorDynConfig", value=value, data_type_need=data_type_need)
             )
             self.bot.log.printf(self.bot.props["def_phrases/ConsoleFormatErrorDynConfig"], log_type=LogType.WARN)
             return
 
-        self.dynamic_json[f"{parameter}/value"] = convert_value
-        self._reload_dynamic_config()
+        self.dynamic_values.set(parameter, convert_value)
 
         await inter.response.send_message(self._gen_value_table())
-        print(self.bot.props["def_phrases/ConsoleEditInfo"]
-                            .format(parameter=parameter, convert_value=value))
+        self.bot.log.debug(lambda: self.bot.phrase("def_phrases/ConsoleEditInfo",
+                                                    parameter=parameter, convert_value=value))
 
     async def config_show(self, inter: ApplicationCommandInteraction):
         """
@@ -202,21 +358,17 @@ class DynamicConfigCog(commands.Cog):
         """
 
         if parameter != "ALL":
-            self.dynamic_json[f"{parameter}/value"] = None
+            self.dynamic_values.set(parameter, None)
         else:
-            var_names = self.dynamic_json.keys()
-            for var_name in var_names:
-                self.dynamic_json[f"{var_name}/value"] = None
-
-        self._reload_dynamic_config()
+            for var_name in list(self.dynamic_values.keys()):
+                self.dynamic_values.set(var_name, None)
 
         await inter.response.send_message(self._gen_value_table())
 
 # method for building class with data from bot_properties
 def build(bot: SmartBot):
     file_name = bot.props["dynamic_config_file_name"]
-    cfg_file = JsonManager(file_name)
-    cfg_file.load_from_file()
+    cfg_file = JsonRegistry.get(file_name)
     chs_to_set_param = list(cfg_file.keys())
     chs_to_del_param = chs_to_set_param.copy()
     chs_to_del_param.append("ALL")
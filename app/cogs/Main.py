@@ -8,7 +8,7 @@ class Main(commands.Cog):
 
     async def ping(self, inter):
         author = inter.author
-        print(author.name, author.nick, author.global_name)
+        self.bot.log.debug("%s %s %s", author.name, author.nick, author.global_name)
         await inter.response.send_message(self.bot.props["def_phrases/ping"])
 
 
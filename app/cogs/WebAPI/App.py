@@ -0,0 +1,203 @@
+from typing import Dict, Any
+from hypercorn.config import Config
+from quart import Quart, request, jsonify, g
+from app.utils.logger import Logger
+from app.factory.errors import IPCError
+from app.utils.ujson import JsonManager, JsonRegistry
+from app.cogs.WebAPI.Models import AuthToken, WebSession, Message
+from app.cogs.WebAPI.Limits import AdmissionControl, RemoteRateLimits
+from math import ceil
+import asyncio
+import os
+
+
+# seconds between the sending of counters of API worker to the bot process
+WORKER_STATS_INTERVAL = 5.0
+
+
+class WebAPI:
+    def __init__(self, sessions: Any, auth_tokens: Dict[str, AuthToken],
+                 limits: dict, log: Logger, name: str = "API",
+                 remote_limits: RemoteRateLimits | None = None):
+        """
+        Quart app with the default routes of WebAPI, it is used in the bot process and in API workers
+
+        Args:
+            sessions: LocalSessions in the bot process or RemoteSessions in API worker
+            auth_tokens: auth tokens by tid
+            limits: config of admission control like web_conf.json["limits"]
+            log: logger for debug notes
+            name: name of Quart app
+            remote_limits: rate limits in the bot process, they are shared by all API workers.
+                           Limit of concurrent requests is still checked in every process
+        """
+        self.sessions = sessions
+        self.auth_tokens = auth_tokens
+        self.log = log
+        self.admission = AdmissionControl(limits)
+        self.remote_limits = remote_limits
+        self._stats_task: asyncio.Task | None = None
+        # remote limits were not reachable by the last request
+        self._remote_limits_down = False
+        self.web_app = Quart(name)
+        self.init_admission_control()
+        self.init_default_quart_preset()
+        # routes which API workers have, routes added later are served only in the bot process
+        self.default_endpoints = frozenset(rule.endpoint for rule in self.web_app.url_map.iter_rules())
+
+    def extra_endpoints(self) -> frozenset:
+        """Endpoints which were added after the default routes, for example by subclass of WebBase"""
+        return frozenset(rule.endpoint for rule in self.web_app.url_map.iter_rules()).difference(
+            self.default_endpoints)
+
+    @staticmethod
+    def load_tokens(web_conf: JsonManager) -> Dict[str, AuthToken]:
+        auth_tokens = {}
+        jm = JsonRegistry.get("tokens.json")
+        evict_oldest = bool(web_conf["sessions/evict_oldest"])
+        for token in jm.buffer:
+            auth_tokens[token["tid"]] = AuthToken(tid=token["tid"],
+                                                  max_sessions=token["limit"],
+                                                  evict_oldest=token.get("evict_oldest", evict_oldest),
+                                                  token_salt=token["salt"],
+                                                  hashed_token=token["hashed_auth_token"],
+                                                  reset_cookie=token["hashed_reset_cookie"])
+        return auth_tokens
+
+    @staticmethod
+    def init_config_quart(web_conf: JsonManager) -> Config:
+        config = Config()
+        #config.keyfile = "app/data/sys/cert.key"
+        #config.certfile = "app/data/sys/cert.crt"
+        config.bind = [web_conf["server/bind"] or "localhost:8080"]
+        return config
+
+    def session_route(self, token_type: str) -> (dict, int):
+        def decorator(func):
+            async def wrapper(session_id, *args, **kwargs):
+                session = await self.sessions.get(session_id)
+                if session is None:
+                    return {"error": "Session was not found. Please create a new session"}, 404
+                check_auth = session.is_invalid_auth(request, token_type=token_type)
+                if check_auth[0]["error"]:
+                    return check_auth
+                self.sessions.touch(session)
+
+                return await func(session, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def check_msg_validation(self, required_params: list | None = None):
+        def decorator(func):
+            async def wrapper(session, *args, **kwargs):
+                message = Message(session)
+                await message.load_from_request(request, required_params)
+                # umid is checked by the owner of sessions, so replay can't be sent to another worker
+                msg_check = message.is_invalid_message(check_replay=False)
+                if msg_check[0]["error"]:
+                    return msg_check
+                if not await self.sessions.remember_umid(session, message.umid, message.content["exp"]):
+                    return {"error": "Request with this umid was already used"}, 403
+                return await func(session, message, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def check_rate(self, route: str, ip: str | None, tid: str | None, session_id: str | None) -> float:
+        """Returns 0 if request is allowed or seconds for the Retry-After header"""
+        # tid is got without any crypto: from args of auth or from the known session
+        if tid is not None:
+            tid = tid if tid in self.auth_tokens else None
+        elif session_id:
+            tid = self.sessions.tid_of(session_id)
+        return self.admission.check(route, ip, tid)
+
+    async def _request_retry_after(self) -> float:
+        route = request.endpoint or ""
+        tid = request.args.get("tid")
+        session_id = (request.view_args or {}).get("session_id")
+        if self.remote_limits is not None:
+            try:
+                retry_after = await self.remote_limits.check(route, request.remote_addr, tid, session_id)
+                self._remote_limits_down = False
+                return retry_after
+            except (IPCError, OSError, asyncio.TimeoutError) as error:
+                # bot process is not reachable, limits of this worker are used until it comes back
+                if not self._remote_limits_down:
+                    self._remote_limits_down = True
+                    self.log.warn("Rate limits are checked locally, bot process is not reachable: %s", error)
+                return self.check_rate(route, request.remote_addr, tid, None)
+        return self.check_rate(route, request.remote_addr, tid, session_id)
+
+    async def _report_stats_loop(self):
+        while True:
+            await asyncio.sleep(WORKER_STATS_INTERVAL)
+            try:
+                await self.remote_limits.report(os.getpid(), queue_rejected=self.admission.gate.rejected)
+            except (IPCError, OSError) as error:
+                # counters are sent again with the next interval
+                self.log.warn("Counters of worker are not sent: %s", error)
+
+    def init_admission_control(self):
+        @self.web_app.before_serving
+        async def start_stats_reporting():
+            if self.remote_limits is not None:
+                self._stats_task = asyncio.get_running_loop().create_task(self._report_stats_loop())
+
+        @self.web_app.after_serving
+        async def stop_stats_reporting():
+            if self._stats_task is not None:
+                self._stats_task.cancel()
+                self._stats_task = None
+
+        @self.web_app.before_request
+        async def admit():
+            retry_after = await self._request_retry_after()
+            if retry_after:
+                return (jsonify({"error": "Too many requests. Please try again later"}), 429,
+                        {"Retry-After": str(ceil(retry_after))})
+            if not await self.admission.gate.acquire():
+                return jsonify({"error": "Server is busy. Please try again later"}), 429, {"Retry-After": "1"}
+            g.admitted = True
+
+        @self.web_app.teardown_request
+        async def release(exc):
+            if g.get("admitted"):
+                g.admitted = False
+                self.admission.gate.release()
+
+    def init_default_quart_preset(self):
+        @self.web_app.route("/v1/auth", methods=["POST"])
+        async def auth():
+            tid = request.args.get("tid")
+            user_auth_token = request.args.get("auth_token")
+            if tid is None or user_auth_token is None:
+                return jsonify({"error": "Bad request. Please enter all arguments."}), 400
+            auth_token = self.auth_tokens.get(tid)
+            if auth_token is None:
+                return jsonify({"error": "Bad request. Token wasn't found"}), 400
+            if not await auth_token.async_is_auth_token_valid(user_auth_token):
+                return jsonify({"error": "Bad request. Use another one token."}), 400
+            auth_data = await self.sessions.create(tid, request.remote_addr,
+                                                   auth_token.max_sessions, auth_token.evict_oldest)
+            if auth_data is None:
+                return jsonify({"error": "Bad request. The limit on the number of sessions has been reached"}), 400
+            return jsonify(auth_data), 201
+
+        @self.web_app.route("/v1/<string:session_id>/refresh_session",
+                            methods=["POST"], endpoint="refresh_token")
+        @self.session_route(token_type="refresh_token")
+        async def refresh_session(session: WebSession):
+            auth_data = await self.sessions.refresh(session)
+            if auth_data is None:
+                # session was closed by another request after it was got
+                return {"error": "Session was not found. Please create a new session"}, 404
+            self.log.debug("Session %s is refreshed to %s", session.sid, auth_data["sid"])
+            return jsonify(auth_data), 201
+
+        @self.web_app.route("/v1/<string:session_id>/close_session",
+                            methods=["POST"], endpoint="close_session")
+        @self.session_route(token_type="refresh_token")
+        async def close_session(session: WebSession):
+            await self.sessions.close(session)
+            self.log.debug("Session %s is closed", session.sid)
+            return jsonify({"error": "", "output": "Session was deleted successful"}), 201
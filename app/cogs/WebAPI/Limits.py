@@ -0,0 +1,156 @@
+from typing import Dict, Tuple
+from time import monotonic
+from app.utils.ipc import IPCClient
+import asyncio
+
+
+# count of buckets in one limiter, after it the full buckets are deleted
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: tokens which are added per second
+            burst: max count of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float | None = None) -> float:
+        """Take one token, returns 0 on success or seconds until the next token"""
+        self._refill(monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: float, max_buckets: int = MAX_BUCKETS):
+        """
+        Token buckets by key (ip, tid)
+
+        Args:
+            rate: requests per second for one key
+            burst: requests which can be done at once
+            max_buckets: count of buckets, after it the full buckets are deleted
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def take(self, key: str) -> float:
+        """Returns 0 if request is allowed or seconds until the next allowed request"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.take()
+
+    def _prune(self) -> None:
+        # full bucket is the same as new one
+        now = monotonic()
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.is_full(now)}
+
+
+class ConcurrencyGate:
+    def __init__(self, max_active: int, max_queue: int):
+        """
+        Limit of requests which are handled at once, the next requests wait in the bounded queue
+
+        Args:
+            max_active: requests which are handled at once
+            max_queue: requests which can wait, the next requests are rejected at once
+        """
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.active = 0
+        self.rejected = 0
+        self._waiting = 0
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    async def acquire(self) -> bool:
+        """Returns False if the queue is full"""
+        if self.active >= self.max_active and self._waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+
+class AdmissionControl:
+    def __init__(self, limits: dict):
+        """
+        Rate limits by ip and by tid for every route and global limit of concurrent requests
+
+        Args:
+            limits: config like web_conf.json["limits"]
+        """
+        self.gate = ConcurrencyGate(limits.get("max_active", 32), limits.get("max_queue", 64))
+        self._default = limits.get("default", {})
+        self._routes = limits.get("routes", {})
+        # (route, "ip" or "tid") > limiter
+        self._limiters: Dict[Tuple[str, str], RateLimiter | None] = {}
+        self.limited = 0
+
+    def _limiter(self, route: str, key_type: str) -> RateLimiter | None:
+        key = (route, key_type)
+        if key not in self._limiters:
+            params = self._routes.get(route, {}).get(key_type, self._default.get(key_type))
+            self._limiters[key] = RateLimiter(*params) if params else None
+        return self._limiters[key]
+
+    def check(self, route: str, ip: str | None, tid: str | None) -> float:
+        """Returns 0 if request is allowed or seconds for the Retry-After header"""
+        for key_type, key in (("ip", ip), ("tid", tid)):
+            if key is None:
+                continue
+            limiter = self._limiter(route, key_type)
+            if limiter is None:
+                continue
+            retry_after = limiter.take(key)
+            if retry_after:
+                self.limited += 1
+                return retry_after
+        return 0
+
+
+class RemoteRateLimits:
+    def __init__(self, client: IPCClient):
+        """
+        Rate limits of API worker, buckets are kept in the bot process, so all workers share them
+
+        Args:
+            client: client of IPC server of the bot process
+        """
+        self.client = client
+
+    async def check(self, route: str, ip: str | None, tid: str | None, session_id: str | None) -> float:
+        """Returns 0 if request is allowed or seconds for the Retry-After header"""
+        return await self.client.call("check_rate", route=route, ip=ip, tid=tid, session_id=session_id)
+
+    async def report(self, pid: int, **counters: int) -> None:
+        """Send counters of this worker to the bot process"""
+        await self.client.notify("report_worker_stats", pid=pid, **counters)
@@ -1,24 +1,41 @@
 import asyncio
-from typing import Callable
-from json import dumps
+from typing import Callable, Dict, Set, Hashable, Deque
+from collections import deque
+from math import ceil
+from time import time
+from json import dumps, loads
 from datetime import datetime
-from quart import Request
-from app.utils.crypter import Hasher, gen_hex_salt, gen_random_line
-from jwt import decode as jwt_decode, encode as jwt_encode, InvalidSignatureError, InvalidIssuerError
+from hmac import compare_digest
+from quart import Request, Response
+from app.utils.logger import Logger
+from app.utils.crypter import Hasher, Signer, gen_hex_salt, gen_random_line
+from jwt import decode as jwt_decode, encode as jwt_encode, InvalidSignatureError, InvalidIssuerError, \
+    ExpiredSignatureError
 
 
 TOKEN_LIFE = {
     "access_token": 3600,
     "refresh_token": 604800
 }
+# header with HMAC-SHA256 of the raw body, signed by the sign_key of session
+SIGNATURE_HEADER = "X-Signature"
+# the farthest exp of message, it limits the time while umid is remembered
+MAX_MESSAGE_LIFE = 300
+# seconds of exp in one bucket of the replay cache
+REPLAY_BUCKET_WIDTH = 8
+# seconds in one slot of the expiry wheel
+EXPIRY_TICK = 1.0
 
 
 class AuthToken:
     def __init__(self, tid: str, max_sessions: int,
                  token_salt: str, hashed_token: str,
-                 reset_cookie: str, encoding: str = "latin1"):
+                 reset_cookie: str, encoding: str = "latin1",
+                 evict_oldest: bool = False):
         self.tid: str = tid
         self.max_sessions = max_sessions
+        # close the least recently used session, when the limit is reached
+        self.evict_oldest = evict_oldest
         self._hashed_token: str = hashed_token
         self._reset_cookie: str = reset_cookie
         self._hasher: Hasher = Hasher("sha256", salt=token_salt)
@@ -27,53 +44,272 @@ class AuthToken:
         hashed_user_auth_token = self._hasher.data_hex_hash(user_auth_token)
         return hashed_user_auth_token == self._hashed_token
 
+    async def async_is_auth_token_valid(self, user_auth_token: str) -> bool:
+        hashed_user_auth_token = await self._hasher.async_data_hex_hash(user_auth_token)
+        return compare_digest(hashed_user_auth_token, self._hashed_token)
+
     def is_reset_cookie_valid(self, user_reset_cookie: str) -> bool:
         hashed_user_reset_cookie = self._hasher.data_hex_hash(user_reset_cookie)
         return hashed_user_reset_cookie == self._hashed_token
 
 
 class JWToken:
-    def __init__(self, sid: str, type_token: str, salt: str):
-        payloads = {
-            "iss": sid,
-            "exp":TOKEN_LIFE[type_token] + datetime.now().timestamp(),
-            "jti": gen_random_line(32)}
-        headers = {
-            "type": type_token
-        }
+    # counters of the verification cache for all tokens
+    cache_hits = 0
+    cache_misses = 0
+
+    def __init__(self, sid: str, type_token: str, salt: str, raw: str | None = None):
+        """
+        Args:
+            sid: id of session
+            type_token: access_token or refresh_token
+            salt: key of the token signature
+            raw: token which was issued before, new token is generated if it is None
+        """
+        if raw is None:
+            payloads = {
+                "iss": sid,
+                "exp":TOKEN_LIFE[type_token] + datetime.now().timestamp(),
+                "jti": gen_random_line(32)}
+            headers = {
+                "type": type_token
+            }
+            raw = jwt_encode(payloads, salt, algorithm="HS256", headers=headers)
+        else:
+            payloads = jwt_decode(raw, salt, algorithms=["HS256"], issuer=sid, options={"verify_exp": False})
         self._salt = salt
         self.iss = sid
         self.jti = payloads["jti"]
-        self.raw: str = jwt_encode(payloads, salt, algorithm="HS256", headers=headers)
+        self.exp: float = payloads["exp"]
+        self.raw: str = raw
+        self._raw_bytes = raw.encode()
+        # token was decoded successfully, so it is valid until exp
+        self._verified = False
 
-    def is_token_invalid(self, test_token) -> (dict, int):
+    def is_token_invalid(self, test_token: str) -> (dict, int):
+        # only the issued token is accepted, so another token is rejected before decoding
+        if not compare_digest(self._raw_bytes, test_token.encode()):
+            return {"error": "Incorrect token. Use another token for auth."}, 403
+        if self._verified and time() < self.exp:
+            JWToken.cache_hits += 1
+            return {"error": ""}, 200
+        JWToken.cache_misses += 1
         try:
             jwt_decode(test_token, self._salt, algorithms=["HS256"], issuer=self.iss)
-            if self.raw == test_token:
-                return {"error": ""}, 200
-            return {"error": "Incorrect token. Use another token for auth."}, 403
+            self._verified = True
+            return {"error": ""}, 200
+        except ExpiredSignatureError:
+            return {"error": "Token was expired. Please refresh session"}, 403
         except InvalidSignatureError:
             return {"error": "Signature check failed. Token was edited by someone."}, 403
         except InvalidIssuerError:
             return {"error": "This token cant be used for auth with with user"}, 403
 
 
+class ReplayCache:
+    def __init__(self, bucket_width: int = REPLAY_BUCKET_WIDTH):
+        """
+        Umids of the messages which were used, every umid is remembered until exp of its message
+
+        Umids are grouped into buckets by exp, so expired umids are deleted with the whole bucket.
+        Memory is limited by the rate of messages and MAX_MESSAGE_LIFE.
+
+        Args:
+            bucket_width: seconds of exp in one bucket
+        """
+        self.bucket_width = bucket_width
+        # number of bucket > umids with exp in this bucket
+        self._buckets: Dict[int, Set[str]] = {}
+        # the smallest number of bucket which can be alive
+        self._oldest = int(time()) // bucket_width
+
+    def __len__(self):
+        return sum(map(len, self._buckets.values()))
+
+    @property
+    def buckets(self) -> int:
+        return len(self._buckets)
+
+    def _drop_expired(self, now: float) -> None:
+        # bucket is expired when all exps in it are in the past
+        current = int(now) // self.bucket_width
+        if current - self._oldest > len(self._buckets):
+            # long pause, it is cheaper to check existing buckets
+            for number in [number for number in self._buckets if number < current]:
+                del self._buckets[number]
+        else:
+            for number in range(self._oldest, current):
+                self._buckets.pop(number, None)
+        self._oldest = max(self._oldest, current)
+
+    def add(self, umid: str, exp: float, now: float | None = None) -> bool:
+        """Remember umid, returns False if umid is already used by a live message"""
+        self._drop_expired(time() if now is None else now)
+        for umids in self._buckets.values():
+            if umid in umids:
+                return False
+        self._buckets.setdefault(int(exp) // self.bucket_width, set()).add(umid)
+        return True
+
+
+class ExpiryWheel:
+    def __init__(self, tick: float = EXPIRY_TICK, log: Logger | None = None):
+        """
+        Timer wheel, one task calls callbacks of all expired keys
+
+        Every key is put into the slot by its deadline, so scheduling, cancelling
+        and expiring of one key cost O(1). Callback is called not earlier than deadline
+        and not later than deadline + tick.
+
+        Args:
+            tick: seconds in one slot
+            log: logger for errors of callbacks
+        """
+        self.tick = tick
+        self.log = log
+        self.errors = 0
+        # number of slot > key > callback
+        self._slots: Dict[int, Dict[Hashable, Callable[[], None]]] = {}
+        # key > number of slot
+        self._keys: Dict[Hashable, int] = {}
+        # the first slot which is not processed
+        self._current = int(time() // tick)
+        self.expired_total = 0
+        # (minute, count of expired keys in the minute) for the last hour
+        self._expired_by_minute: Deque[list] = deque(maxlen=60)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], None]) -> None:
+        """Call callback after deadline (timestamp), previous deadline of key is cancelled"""
+        self.cancel(key)
+        number = max(ceil(deadline / self.tick), self._current)
+        self._slots.setdefault(number, {})[key] = callback
+        self._keys[key] = number
+
+    def cancel(self, key: Hashable) -> bool:
+        number = self._keys.pop(key, None)
+        if number is None:
+            return False
+        # slot is already taken by advance, if key is cancelled by callback of the same slot
+        slot = self._slots.get(number)
+        if slot is not None:
+            del slot[key]
+            if not slot:
+                del self._slots[number]
+        return True
+
+    def advance(self, now: float | None = None) -> int:
+        """Call callbacks of all expired keys, returns count of them"""
+        now = time() if now is None else now
+        last = int(now // self.tick)
+        if last < self._current:
+            return 0
+        if last - self._current > len(self._slots):
+            # long pause, it is cheaper to check existing slots
+            numbers = sorted(number for number in self._slots if number <= last)
+        else:
+            numbers = range(self._current, last + 1)
+        self._current = last + 1
+
+        count = 0
+        for number in numbers:
+            slot = self._slots.pop(number, None)
+            if slot is None:
+                continue
+            for key, callback in slot.items():
+                # key could be cancelled or scheduled again by the previous callback
+                if self._keys.get(key) != number:
+                    continue
+                del self._keys[key]
+                count += 1
+                try:
+                    callback()
+                except Exception as error:
+                    # one broken callback must not stop the expiry of other keys
+                    self.errors += 1
+                    if self.log is not None:
+                        self.log.error("Expiry callback of %s failed: %s", key, error)
+        if count:
+            self.__count_expired(now, count)
+        return count
+
+    def __count_expired(self, now: float, count: int) -> None:
+        self.expired_total += count
+        minute = int(now // 60)
+        if self._expired_by_minute and self._expired_by_minute[-1][0] == minute:
+            self._expired_by_minute[-1][1] += count
+        else:
+            self._expired_by_minute.append([minute, count])
+
+    def expired_per_minute(self, now: float | None = None) -> int:
+        """Count of keys which were expired during the last full minute"""
+        minute = int((time() if now is None else now) // 60) - 1
+        for item_minute, count in reversed(self._expired_by_minute):
+            if item_minute == minute:
+                return count
+            if item_minute < minute:
+                break
+        return 0
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.advance()
+            except Exception as error:
+                self.errors += 1
+                if self.log is not None:
+                    self.log.error("Expiry wheel failed: %s", error)
+            await asyncio.sleep(self.tick)
+
+
 class WebSession:
-    def __init__(self, tid: str, ip: str, on_delete: Callable):
+    def __init__(self, tid: str, ip: str, on_delete: Callable, snapshot: dict | None = None):
+        """
+        Args:
+            tid: id of auth token
+            ip: address of the client
+            on_delete: function which is called with tid and sid, when session is expired
+            snapshot: data from to_snapshot for the restoring of session, new session is created if it is None
+        """
         self.ip: str = ip
         self.tid: str = tid
         self.on_delete = on_delete
-        self.sid: str = gen_random_line(24)
-        self._session_salt = gen_hex_salt(64)
+        snapshot = snapshot or {}
+        self.sid: str = snapshot.get("sid") or gen_random_line(24)
+        self._session_salt = snapshot.get("salt") or gen_hex_salt(64)
         self.session_hasher = Hasher("sha256", salt=self._session_salt)
-        self._access_token = JWToken(sid=self.sid, type_token="access_token", salt=self._session_salt)
-        self._refresh_token = JWToken(sid=self.sid, type_token="refresh_token", salt=self._session_salt)
+        # key for the signing of messages is derived once per session
+        self.signer = Signer(self.session_hasher.data_hash(self.sid.encode()))
+        self._access_token = JWToken(sid=self.sid, type_token="access_token", salt=self._session_salt,
+                                     raw=snapshot.get("access_token"))
+        self._refresh_token = JWToken(sid=self.sid, type_token="refresh_token", salt=self._session_salt,
+                                      raw=snapshot.get("refresh_token"))
+        self.replay_cache = ReplayCache()
+        self.access_expired = False
+
+    @property
+    def expire_time(self) -> float:
+        return self._refresh_token.exp
 
-    async def on_session_expired(self):
-        await asyncio.sleep(TOKEN_LIFE["refresh_token"]+1)
+    @property
+    def access_expire_time(self) -> float:
+        return self._access_token.exp
+
+    def on_session_expired(self) -> None:
         self.on_delete(self.tid, self.sid)
 
+    def on_access_expired(self) -> None:
+        self.access_expired = True
+
     def is_invalid_auth(self, session_request: Request, token_type: str) -> (dict, int):
+        if token_type == "access_token" and self.access_expired:
+            # token is not decoded, if it is known that it is expired
+            return {"error": "Token was expired. Please refresh session"}, 403
         if session_request.remote_addr != self.ip:
             return {"error": "This session was created for another device. Please choose another session"}, 403
         auth_header = session_request.authorization
@@ -93,35 +329,58 @@ class WebSession:
         output = {
             "sid": self.sid,
             "salt": self._session_salt,
+            "sign_key": self.signer.key.hex(),
             "access_token": self._access_token.raw,
             "refresh_token": self._refresh_token.raw
         }
         return output
 
+    def to_snapshot(self) -> dict:
+        """Data for the restoring of session after restart"""
+        return {
+            "tid": self.tid,
+            "ip": self.ip,
+            "sid": self.sid,
+            "salt": self._session_salt,
+            "access_token": self._access_token.raw,
+            "refresh_token": self._refresh_token.raw
+        }
+
 class Message:
-    def __init__(self, session: WebSession, content: dict | None = None):
+    def __init__(self, session: WebSession, content: dict | None = None, log: Logger | None = None):
         self.umid: str | None = None
+        self.log = log
+        # body of the request as it was received, signature is checked for these bytes
+        self.raw: bytes | None = None
+        self.signature: str | None = None
         self.session: WebSession = session
         self.required_params: list | None = None
         self.content: dict | None = content
 
-    async def pack(self, exp_after: int = 60) -> dict:
-        print(self.content)
+    async def pack(self, exp_after: int = 60, status: int = 200) -> Response:
+        """Serialize content once and sign the same bytes which are sent"""
         self.content["exp"] = int(datetime.now().timestamp() + exp_after)
-        print(self.content)
-        sign = self.session.session_hasher.data_hex_hash(dumps(self.content))
-        self.content["signature"] = sign
-        return self.content.copy()
+        if self.log is not None:
+            self.log.debug("Packed message: %s", self.content)
+        body = dumps(self.content).encode()
+        response = Response(body, status=status, content_type="application/json")
+        response.headers[SIGNATURE_HEADER] = self.session.signer.sign(body)
+        return response
 
 
     async def load_from_request(self, session_request: Request, required_params: list):
-        self.content = await session_request.get_json(silent=True, force=True)
+        self.raw = await session_request.get_data(cache=True)
+        self.signature = session_request.headers.get(SIGNATURE_HEADER)
         self.required_params = required_params
-        if self.content is not None:
+        try:
+            self.content = loads(self.raw)
+        except ValueError:
+            self.content = None
+        if type(self.content) is dict:
             self.umid = self.content.get("umid")
 
 
-    def is_invalid_message(self) -> (dict, int):
+    def is_invalid_message(self, check_replay: bool = True) -> (dict, int):
         if type(self.content) is not dict:
             return {"error": "Request must be in the json format"}, 400
 
@@ -132,30 +391,43 @@ class Message:
         sign_check = self.is_signature_invalid()
         if sign_check[0]["error"]:
             return sign_check
+
+        if type(self.umid) is not str or not self.umid:
+            return {"error": "Umid was not found"}, 400
+        # only signed messages are remembered, so cache can't be filled by someone else
+        if check_replay:
+            replay_check = self.is_replayed_message()
+            if replay_check[0]["error"]:
+                return replay_check
         if None in [self.content.get(param) for param in self.required_params]:
             return {"error": f"Request is not complete. Missing important args for this method. Pls check docs for the fixing this problem"}, 400
         return {"error": ""}, 200
 
 
     def is_signature_invalid(self) -> (dict, int):
-        sign = self.content.get("signature")
-        if sign is None:
-            return {"error": "Signature was not found"}, 400
-        hasher = self.session.session_hasher
-        temp_cont = self.content.copy()
-        del temp_cont["signature"]
-        temp_sign = hasher.data_hex_hash(dumps(temp_cont))
-        if temp_sign == sign:
-
+        if self.signature is None:
+            return {"error": f"Signature was not found. Send it in the {SIGNATURE_HEADER} header"}, 400
+        if self.session.signer.is_valid(self.raw, self.signature):
             return {"error": ""}, 200
         else:
             return {"error": "Request was edited by someone"}, 403
 
+    def is_replayed_message(self) -> (dict, int):
+        if type(self.umid) is not str or not self.umid:
+            return {"error": "Umid was not found"}, 400
+        if not self.session.replay_cache.add(self.umid, self.content["exp"]):
+            return {"error": "Request with this umid was already used"}, 403
+        return {"error": ""}, 200
+
     def is_expired_message(self) -> (dict, int):
         exp_time = self.content.get("exp")
         if exp_time is None:
             return {"error": "Exp was not found"}, 400
-        if datetime.now().timestamp() > exp_time:
+        if type(exp_time) not in (int, float):
+            return {"error": "Exp must be a number"}, 400
+        now = datetime.now().timestamp()
+        if now > exp_time:
             return {"error": "Request time was expired"}, 403
-        else:
-            return {"error": ""}, 200
\ No newline at end of file
+        if exp_time - now > MAX_MESSAGE_LIFE:
+            return {"error": f"Exp can't be later than {MAX_MESSAGE_LIFE} seconds from now"}, 400
+        return {"error": ""}, 200
@@ -0,0 +1,267 @@
+from typing import Callable, Dict, List, Tuple
+from time import time, monotonic
+from app.utils.ipc import IPCClient
+from app.utils.logger import Logger
+from app.utils.ujson import JsonRegistry, JsonManagerWithCrypt, AddressType
+from app.cogs.WebAPI.Models import WebSession, ExpiryWheel
+import asyncio
+
+
+# seconds while API worker uses session data without asking the bot process
+SESSION_CACHE_TTL = 1.0
+# count of cached sessions in API worker, after it the expired ones are deleted
+SESSION_CACHE_SIZE = 10000
+
+
+class SessionRegistry:
+    def __init__(self, expiry: ExpiryWheel | None = None,
+                 snapshot_file: str | None = None,
+                 log: Logger | None = None):
+        """
+        Index of web sessions by sid and by tid
+
+        Sessions of every tid are kept in the insertion-ordered dict (used as ordered set),
+        the first session is the least recently used one. All methods are synchronous,
+        so handlers can't see the registry in the middle of the changing.
+
+        Args:
+            expiry: timer wheel for the expiry of tokens
+            snapshot_file: name of .crptjson file for the saving of sessions, sessions are not saved if it is None
+            log: logger for the snapshot notes
+        """
+        self.sessions: Dict[str, WebSession] = {}
+        # tid > sids from the oldest to the newest
+        self._by_tid: Dict[str, Dict[str, None]] = {}
+        self.expiry = expiry if expiry is not None else ExpiryWheel(log=log)
+        self.log = log
+        self.evicted_total = 0
+        self._snapshot_file = snapshot_file
+        # sessions were changed after the last saving
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.sessions
+
+    def get(self, sid: str) -> WebSession | None:
+        return self.sessions.get(sid)
+
+    def count(self, tid: str) -> int:
+        return len(self._by_tid.get(tid, ()))
+
+    def sessions_map(self) -> Dict[str, List[str]]:
+        """Sids of every tid from the oldest to the newest"""
+        return {tid: list(sids) for tid, sids in self._by_tid.items()}
+
+    def add(self, session: WebSession, max_sessions: int | None = None, evict_oldest: bool = False) -> bool:
+        """
+        Add session, returns False if the limit of sessions is reached
+
+        Args:
+            session: new session
+            max_sessions: limit of sessions for tid of session
+            evict_oldest: close the least recently used session instead of the refusing
+        """
+        sids = self._by_tid.setdefault(session.tid, {})
+        if max_sessions is not None and len(sids) >= max_sessions:
+            # with limit 0 even eviction of all sessions doesn't give the place for the new one
+            if not evict_oldest or max_sessions <= 0:
+                return False
+            while sids and len(sids) >= max_sessions:
+                self.remove(self.sessions[next(iter(sids))])
+                self.evicted_total += 1
+        self.sessions[session.sid] = session
+        sids[session.sid] = None
+        self.expiry.schedule((session.sid, "refresh_token"), session.expire_time, session.on_session_expired)
+        self.expiry.schedule((session.sid, "access_token"), session.access_expire_time, session.on_access_expired)
+        self._dirty = True
+        return True
+
+    def remove(self, session: WebSession) -> bool:
+        if self.sessions.pop(session.sid, None) is None:
+            return False
+        self._by_tid[session.tid].pop(session.sid, None)
+        self.expiry.cancel((session.sid, "refresh_token"))
+        self.expiry.cancel((session.sid, "access_token"))
+        self._dirty = True
+        return True
+
+    def replace(self, old_session: WebSession, new_session: WebSession) -> None:
+        """Change session to the refreshed one, limit of sessions is not checked"""
+        self.remove(old_session)
+        self.add(new_session)
+
+    def touch(self, session: WebSession) -> None:
+        """Mark session as the most recently used one"""
+        sids = self._by_tid.get(session.tid)
+        if sids is not None and sids.pop(session.sid, 0) is None:
+            sids[session.sid] = None
+
+    # snapshot methods
+
+    def save_snapshot(self, force: bool = False) -> bool:
+        """Write all sessions to the encrypted file, if they were changed"""
+        if self._snapshot_file is None or not (self._dirty or force):
+            return False
+        manager = JsonRegistry.get(self._snapshot_file, AddressType.CFILE, manager_class=JsonManagerWithCrypt)
+        manager.buffer = {"sessions": [session.to_snapshot() for session in self.sessions.values()]}
+        manager.write_in_file()
+        self._dirty = False
+        return True
+
+    def load_snapshot(self, on_delete: Callable) -> int:
+        """Restore sessions which are not expired, returns count of them"""
+        if self._snapshot_file is None:
+            return 0
+        manager = JsonRegistry.get(self._snapshot_file, AddressType.CFILE, manager_class=JsonManagerWithCrypt)
+        now = time()
+        count = 0
+        for data in manager["sessions"] or []:
+            try:
+                session = WebSession(data["tid"], data["ip"], on_delete=on_delete, snapshot=data)
+            except Exception as error:
+                if self.log is not None:
+                    self.log.warn("Session from snapshot is not restored: %s", error)
+                continue
+            if session.expire_time <= now:
+                continue
+            self.add(session)
+            count += 1
+        self._dirty = False
+        return count
+
+
+class LocalSessions:
+    def __init__(self, registry: SessionRegistry):
+        """
+        Sessions of WebAPI in the bot process
+
+        Args:
+            registry: registry of sessions
+        """
+        self.registry = registry
+
+    def on_session_expired(self, tid: str, sid: str) -> None:
+        session = self.registry.get(sid)
+        if session is not None:
+            self.registry.remove(session)
+
+    def tid_of(self, sid: str) -> str | None:
+        session = self.registry.get(sid)
+        return session.tid if session is not None else None
+
+    async def get(self, sid: str) -> WebSession | None:
+        return self.registry.get(sid)
+
+    async def create(self, tid: str, ip: str, max_sessions: int, evict_oldest: bool = False) -> dict | None:
+        """Create session and return auth data, returns None if the limit of sessions is reached"""
+        session = WebSession(tid, ip, on_delete=self.on_session_expired)
+        if not self.registry.add(session, max_sessions, evict_oldest):
+            return None
+        return session.get_auth_data()
+
+    async def refresh(self, session: WebSession) -> dict:
+        new_session = WebSession(session.tid, session.ip, on_delete=self.on_session_expired)
+        self.registry.replace(session, new_session)
+        return new_session.get_auth_data()
+
+    async def close(self, session: WebSession) -> None:
+        self.registry.remove(session)
+
+    async def remember_umid(self, session: WebSession, umid: str, exp: float) -> bool:
+        return session.replay_cache.add(umid, exp)
+
+    def touch(self, session: WebSession) -> None:
+        self.registry.touch(session)
+
+    # methods for API workers, sessions are passed by sid
+
+    def ipc_handlers(self) -> Dict[str, Callable]:
+        return {
+            "get_session": self._ipc_get_session,
+            "create_session": self.create,
+            "refresh_session": self._ipc_refresh_session,
+            "close_session": self._ipc_close_session,
+            "remember_umid": self._ipc_remember_umid,
+            "touch_session": self._ipc_touch_session
+        }
+
+    def _ipc_get_session(self, sid: str) -> dict | None:
+        session = self.registry.get(sid)
+        return session.to_snapshot() if session is not None else None
+
+    async def _ipc_refresh_session(self, sid: str) -> dict | None:
+        session = self.registry.get(sid)
+        return await self.refresh(session) if session is not None else None
+
+    def _ipc_close_session(self, sid: str) -> bool:
+        session = self.registry.get(sid)
+        return session is not None and self.registry.remove(session)
+
+    def _ipc_remember_umid(self, sid: str, umid: str, exp: float) -> bool:
+        session = self.registry.get(sid)
+        return session is not None and session.replay_cache.add(umid, exp)
+
+    def _ipc_touch_session(self, sid: str) -> None:
+        session = self.registry.get(sid)
+        if session is not None:
+            self.registry.touch(session)
+
+
+class RemoteSessions:
+    def __init__(self, client: IPCClient, cache_ttl: float = SESSION_CACHE_TTL):
+        """
+        Sessions of WebAPI for the API worker, registry of sessions is in the bot process
+
+        Sessions are rebuilt from the snapshot and cached for cache_ttl seconds,
+        so closing of session in another worker is seen not later than after cache_ttl.
+
+        Args:
+            client: client of IPC server of the bot process
+            cache_ttl: seconds while session data is used without asking the bot process
+        """
+        self.client = client
+        self.cache_ttl = cache_ttl
+        # sid > (session, time of the expiry of cache)
+        self._cache: Dict[str, Tuple[WebSession, float]] = {}
+
+    async def get(self, sid: str) -> WebSession | None:
+        now = monotonic()
+        cached = self._cache.get(sid)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        snapshot = await self.client.call("get_session", sid=sid)
+        if snapshot is None:
+            self._cache.pop(sid, None)
+            return None
+        if cached is not None and cached[0].to_snapshot() == snapshot:
+            # tokens are the same, so verified tokens are kept
+            session = cached[0]
+        else:
+            session = WebSession(snapshot["tid"], snapshot["ip"], on_delete=None, snapshot=snapshot)
+        if len(self._cache) >= SESSION_CACHE_SIZE:
+            self._cache = {key: value for key, value in self._cache.items() if value[1] > now}
+        self._cache[sid] = (session, now + self.cache_ttl)
+        return session
+
+    async def create(self, tid: str, ip: str, max_sessions: int, evict_oldest: bool = False) -> dict | None:
+        return await self.client.call("create_session", tid=tid, ip=ip,
+                                      max_sessions=max_sessions, evict_oldest=evict_oldest)
+
+    async def refresh(self, session: WebSession) -> dict | None:
+        """Returns None if session was closed in the bot process"""
+        self._cache.pop(session.sid, None)
+        return await self.client.call("refresh_session", sid=session.sid)
+
+    async def close(self, session: WebSession) -> None:
+        self._cache.pop(session.sid, None)
+        await self.client.call("close_session", sid=session.sid)
+
+    async def remember_umid(self, session: WebSession, umid: str, exp: float) -> bool:
+        return await self.client.call("remember_umid", sid=session.sid, umid=umid, exp=exp)
+
+    def touch(self, session: WebSession) -> None:
+        # answer is not needed, so request is not waited
+        asyncio.get_running_loop().create_task(self.client.notify("touch_session", sid=session.sid))
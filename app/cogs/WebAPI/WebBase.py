@@ -1,36 +1,46 @@
-from typing import Dict, List
 from disnake.ext import commands
 from hypercorn.asyncio import serve
-from hypercorn.config import Config
-from quart import Quart, request, jsonify
+from quart import request
 from app.utils.smartdisnake import SmartBot
-from app.utils.ujson import JsonManager, AddressType
-from app.cogs.WebAPI.Models import AuthToken, WebSession, Message
+from app.utils.ujson import JsonRegistry, launch_path
+from app.utils.ipc import IPCServer
+from app.cogs.WebAPI.Models import Message, JWToken
+from app.cogs.WebAPI.Sessions import SessionRegistry, LocalSessions
+from app.cogs.WebAPI.App import WebAPI
+from sys import executable
+from typing import Dict
+import asyncio
+import os
 
 
 class WebBase(commands.Cog):
     def __init__(self, bot: SmartBot, name: str = "API"):
         self.bot = bot
-        self.auth_tokens: Dict[str, AuthToken] = {}
-        self.sessions_map: Dict[str, List[str]] = {}
-        self.sessions: Dict[str, WebSession] = {}
-        self.web_app = Quart(name)
-        self.load_tokens()
-        self.init_default_quart_preset()
+        self.web_conf = JsonRegistry.get("web_conf.json")
+        self.registry = SessionRegistry(snapshot_file=self.web_conf["sessions/snapshot_file"], log=bot.log)
+        self.sessions = LocalSessions(self.registry)
+        self.auth_tokens = WebAPI.load_tokens(self.web_conf)
+        self.api = WebAPI(self.sessions, self.auth_tokens, self.web_conf["limits"] or {}, bot.log, name)
+        self.web_app = self.api.web_app
+        self.admission = self.api.admission
+        restored = self.registry.load_snapshot(on_delete=self.sessions.on_session_expired)
+        if restored:
+            self.bot.log.info("Restored %s web sessions from snapshot", restored)
+        # server for API workers and process of hypercorn with them
+        self.ipc: IPCServer | None = None
+        self._server_process: asyncio.subprocess.Process | None = None
+        # pid of API worker > its counters
+        self._worker_stats: Dict[int, dict] = {}
+
+    def cog_unload(self) -> None:
+        self.registry.save_snapshot()
+        if self._server_process is not None and self._server_process.returncode is None:
+            self._server_process.terminate()
+        if self.ipc is not None:
+            self.ipc.close()
 
     def session_route(self, token_type: str) -> (dict, int):
-        def decorator(func):
-            async def wrapper(session_id, *args, **kwargs):
-                session = self.sessions.get(session_id)
-                if session is None:
-                    return {"error": "Session was not found. Please create a new session"}, 404
-                check_auth = session.is_invalid_auth(request, token_type=token_type)
-                if check_auth[0]["error"]:
-                    return check_auth
-
-                return await func(session, *args, **kwargs)
-            return wrapper
-        return decorator
+        return self.api.session_route(token_type)
 
     @staticmethod
     def check_msg_validation(required_params: list | None = None):
@@ -46,76 +56,76 @@ class WebBase(commands.Cog):
         return decorator
 
     def on_session_expired(self, tid: str, sid: str):
-        if self.sessions.get(sid) is not None:
-            del self.sessions[sid]
-            self.sessions_map[tid].remove(sid)
-
-    def load_tokens(self):
-        jm = JsonManager(AddressType.FILE, "tokens.json")
-        jm.load_from_file()
-        for token in jm.buffer:
-            self.sessions_map.setdefault(token["tid"], [])
-            self.auth_tokens[token["tid"]] = AuthToken(tid=token["tid"],
-                                                       max_sessions=token["limit"],
-                                                       token_salt=token["salt"],
-                                                       hashed_token=token["hashed_auth_token"],
-                                                       reset_cookie=token["hashed_reset_cookie"])
-
-    def init_default_quart_preset(self):
-        @self.web_app.route("/v1/auth", methods=["POST"])
-        async def auth():
-            tid = request.args.get("tid")
-            user_auth_token = request.args.get("auth_token")
-            if tid is None or user_auth_token is None:
-                return jsonify({"error": "Bad request. Please enter all arguments."}), 400
-            auth_token = self.auth_tokens.get(tid)
-            if auth_token is None:
-                return jsonify({"error": "Bad request. Token wasn't found"}), 400
-            if not auth_token.is_auth_token_valid(user_auth_token):
-                return jsonify({"error": "Bad request. Use another one token."}), 400
-            if len(self.sessions_map.get(tid)) >= auth_token.max_sessions:
-                return jsonify({"error": "Bad request. The limit on the number of sessions has been reached"}), 400
-            new_session = WebSession(tid, request.remote_addr, on_delete=self.on_session_expired)
-            self.sessions_map[tid].append(new_session.sid)
-            self.sessions[new_session.sid] = new_session
-            return jsonify(new_session.get_auth_data()), 201
-
-        @self.web_app.route("/v1/<string:session_id>/refresh_session",
-                            methods=["POST"], endpoint="refresh_token")
-        @self.session_route(token_type="refresh_token")
-        async def refresh_session(session: WebSession):
-            print(self.sessions_map)
-            tid, sid = session.tid, session.sid
-            new_session = WebSession(tid, session.ip, on_delete=self.on_session_expired)
-            del self.sessions[sid]
-            self.sessions_map[tid].remove(sid)
-            self.sessions[new_session.sid] = new_session
-            self.sessions_map[tid].append(new_session.sid)
-            print(self.sessions_map)
-            return jsonify(new_session.get_auth_data()), 201
-
-        @self.web_app.route("/v1/<string:session_id>/close_session",
-                            methods=["POST"], endpoint="close_session")
-        @self.session_route(token_type="refresh_token")
-        async def close_session(session: WebSession):
-            print(self.sessions_map)
-            tid, sid = session.tid, session.sid
-            del self.sessions[sid]
-            self.sessions_map[tid].remove(sid)
-            print(self.sessions_map)
-            return jsonify({"error": "", "output": "Session was deleted successful"}), 201
-
-
-    @staticmethod
-    def init_config_quart() -> Config:
-        config = Config()
-        #config.keyfile = "app/data/sys/cert.key"
-        #config.certfile = "app/data/sys/cert.crt"
-        config.bind = ['localhost:8080']
-        return config
+        self.sessions.on_session_expired(tid, sid)
+
+    def session_stats(self) -> dict:
+        expiry = self.registry.expiry
+        return {
+            "live_sessions": len(self.registry),
+            "scheduled_expiries": len(expiry),
+            "expired_total": expiry.expired_total,
+            "expired_per_minute": expiry.expired_per_minute(),
+            "evicted_total": self.registry.evicted_total,
+            "jwt_cache_hits": JWToken.cache_hits,
+            "jwt_cache_misses": JWToken.cache_misses,
+            # rate limits of workers are checked in this process too
+            "rate_limited": self.admission.limited,
+            "queue_rejected": self.admission.gate.rejected + sum(stats.get("queue_rejected", 0)
+                                                                 for stats in self._worker_stats.values()),
+            "workers_reported": len(self._worker_stats)
+        }
+
+    def _ipc_report_worker_stats(self, pid: int, **counters: int) -> None:
+        self._worker_stats[pid] = counters
+
+    async def save_sessions_loop(self):
+        interval = self.web_conf["sessions/snapshot_interval"] or 30
+        while True:
+            await asyncio.sleep(interval)
+            self.registry.save_snapshot()
+
+    async def serve_in_workers(self, workers: int):
+        """Run API in hypercorn worker processes, they get sessions from this process over IPC"""
+        ipc_path = launch_path + (self.web_conf["server/ipc_socket"] or "app/data/sys/webapi.sock")
+        self.ipc = IPCServer(ipc_path, log=self.bot.log)
+        for method, handler in self.sessions.ipc_handlers().items():
+            self.ipc.register(method, handler)
+        # buckets of rate limits are shared by all workers
+        self.ipc.register("check_rate", self.api.check_rate)
+        self.ipc.register("report_worker_stats", self._ipc_report_worker_stats)
+        self._worker_stats.clear()
+        await self.ipc.start()
+
+        env = dict(os.environ, WEBAPI_IPC_SOCKET=ipc_path, WEBAPI_NAME=self.web_app.name,
+                   PYTHONPATH=launch_path.rstrip("/"))
+        bind = self.web_conf["server/bind"] or "localhost:8080"
+        self._server_process = await asyncio.create_subprocess_exec(
+            executable, "-m", "hypercorn", "--workers", str(workers), "--bind", bind,
+            "app.cogs.WebAPI.Worker:app", cwd=launch_path, env=env)
+        self.bot.log.info("WebAPI is served by %s workers on %s", workers, bind)
+        try:
+            await self._server_process.wait()
+            self.bot.log.warn("WebAPI workers are stopped with code %s", self._server_process.returncode)
+        finally:
+            # workers must not live without the bot process
+            if self._server_process.returncode is None:
+                self._server_process.terminate()
+            self.ipc.close()
 
     def add_quart_to_async_task(self):
-        self.bot.add_async_task(serve(self.web_app, WebBase.init_config_quart()))
+        workers = self.web_conf["server/workers"] or 0
+        extra_endpoints = self.api.extra_endpoints()
+        if workers > 0 and extra_endpoints:
+            # workers build only the default routes, so other routes would answer 404 there
+            self.bot.log.error("WebAPI workers are not started, routes %s are served only in the bot process. "
+                               "WebAPI is served in the bot process", ", ".join(sorted(extra_endpoints)))
+            workers = 0
+        if workers > 0:
+            self.bot.add_async_task(self.serve_in_workers(workers))
+        else:
+            self.bot.add_async_task(serve(self.web_app, WebAPI.init_config_quart(self.web_conf)))
+        self.bot.add_async_task(self.registry.expiry.run())
+        self.bot.add_async_task(self.save_sessions_loop())
 
     @commands.Cog.listener(name="on_ready")
     async def on_ready(self):
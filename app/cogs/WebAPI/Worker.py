@@ -0,0 +1,24 @@
+"""
+Entry point of API worker process: hypercorn app.cogs.WebAPI.Worker:app
+
+Worker is started by WebBase, when key "server/workers" of web_conf.json is more than 0
+"""
+from app.utils.ipc import IPCClient
+from app.utils.logger import Logger
+from app.utils.ujson import JsonRegistry
+from app.cogs.WebAPI.Sessions import RemoteSessions
+from app.cogs.WebAPI.Limits import RemoteRateLimits
+from app.cogs.WebAPI.App import WebAPI
+import os
+
+
+web_conf = JsonRegistry.get("web_conf.json")
+# one connection for all calls of the worker
+ipc_client = IPCClient(os.environ["WEBAPI_IPC_SOCKET"])
+api = WebAPI(RemoteSessions(ipc_client),
+             WebAPI.load_tokens(web_conf),
+             web_conf["limits"] or {},
+             Logger(name=f"API worker {os.getpid()}"),
+             os.environ.get("WEBAPI_NAME", "API"),
+             remote_limits=RemoteRateLimits(ipc_client))
+app = api.web_app
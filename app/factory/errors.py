@@ -71,3 +71,83 @@ class DatabaseConnectionDataError(Exception):
 
     def __init__(self, name: str, par: str):
         super().__init__(f"Parameter \"{par}\" for database \"{name}\" are not found.")
+
+
+class DatabaseColumnTypeError(Exception):
+    def __init__(self, table: str, column: str, type_name: str):
+        """
+        Exception for error in the table spec
+
+        Args:
+            table - table's name
+            column - column's name
+            type_name - name of type which is not found in map_types
+
+        """
+        super().__init__(f"Type \"{type_name}\" of column \"{column}\" in table \"{table}\" is not found in map_types.")
+
+
+class DatabaseDialectError(Exception):
+    def __init__(self, dialect: str, operation: str):
+        """
+        Exception for operation which is not supported by the dialect of DB
+
+        Args:
+            dialect - dialect's name
+            operation - operation's name
+
+        """
+        super().__init__(f"Operation \"{operation}\" is not supported for dialect \"{dialect}\".")
+
+
+class DatabaseWriterClosedError(Exception):
+    def __init__(self, db_path: str):
+        """
+        Exception for writing through the closed LiteDBWriter
+
+        Args:
+            db_path - path to db file
+
+        """
+        super().__init__(f"Writer of database \"{db_path}\" is closed, statement is not queued.")
+
+
+class RconServerNameError(Exception):
+    def __init__(self, name: str):
+        """
+        Exception for error in the load connection data for RCON server
+
+        Args:
+            name - server's name
+
+        """
+        super().__init__(f"Connection data for RCON server \"{name}\" are not found.")
+
+
+class TemplateVariableError(KeyError):
+    def __init__(self, name: str, variables: set | frozenset):
+        """
+        Exception for unknown or missing variables of the template
+
+        Args:
+            name - template's name or line
+            variables - names of the variables
+
+        """
+        self.variables = variables
+        super().__init__(f"Variables {', '.join(sorted(variables))} of the template \"{name}\" are not set.")
+
+    def __str__(self):
+        return self.args[0]
+
+
+class IPCError(Exception):
+    def __init__(self, reason: str):
+        """
+        Exception for error of the call to other process
+
+        Args:
+            reason - error from IPC server or connection
+
+        """
+        super().__init__(f"IPC call failed: {reason}")
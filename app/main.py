@@ -1,4 +1,4 @@
-from utils.ujson import JsonManagerWithCrypt
+from app.utils.ujson import JsonManagerWithCrypt
 from factory.errors import FactoryStartArgumentError
 from sys import argv as sys_argv
 from json5 import loads
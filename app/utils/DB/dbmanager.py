@@ -1,16 +1,68 @@
 import sqlite3
 from sys import path as sys_path
-from sqlalchemy.engine import create_engine
+from sqlalchemy.engine import create_engine, Engine
 from sqlalchemy.orm import sessionmaker
-from app.utils.ujson import JsonManagerWithCrypt, AddressType
+from app.utils.ujson import SecretsStore
 from urllib.parse import quote_plus
-from sqlalchemy import MetaData, NullPool
-from app.factory.errors import DatabaseConnectionDataError, DatabaseNameError
+from sqlalchemy import MetaData, NullPool, QueuePool, Table, Column, insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from app.utils.DB.db_data_types import map_types
+from app.factory.errors import (DatabaseConnectionDataError, DatabaseNameError, DatabaseColumnTypeError,
+                                DatabaseDialectError, DatabaseWriterClosedError)
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Dict, Tuple, List, Iterable, Iterator
+from threading import Lock, Thread, Event
+from queue import Queue, Empty
+from contextlib import contextmanager
+from time import perf_counter, monotonic, sleep
+import asyncio
+import atexit
 
 
 launch_path = sys_path[1]
 
 
+# threads for the queries from coroutines, so they don't block the event loop
+DB_EXECUTOR_WORKERS = 8
+_db_executor: ThreadPoolExecutor | None = None
+_db_executor_lock = Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+        return _db_executor
+
+
+def shutdown_db_executor(wait: bool = True) -> None:
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is not None:
+            _db_executor.shutdown(wait=wait)
+            _db_executor = None
+
+
+async def run_in_db_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_db_executor(), func, *args)
+
+
+# attempts and delay in seconds for the statement of LiteDBWriter when db is locked by another connection
+BUSY_RETRIES = 5
+BUSY_RETRY_DELAY = 0.05
+
+
+def _is_busy_error(error: sqlite3.OperationalError) -> bool:
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
 class DBType:
     """
 
@@ -21,17 +73,52 @@ class DBType:
     SQLite3 = "sqlite:////" + launch_path + "/app/data/local_dbs/{db_name}.db"
 
 
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which counts checkouts and time of waiting for a free connection
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start_time = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_time = perf_counter() - start_time
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
 class DBManager:
     """
     Basic manager for raw interact with db
 
     Without models and tables shapes
     """
-    def __init__(self, database_name: str, db_type: str, echo: bool = False):
+    # engines and session makers shared by all managers of the same database with the same settings,
+    # key is (database_name, db_type, connection url, echo, pool args)
+    _engines: Dict[tuple, Tuple[Engine, sessionmaker]] = {}
+    _engines_lock = Lock()
+
+    def __init__(self, database_name: str, db_type: str, echo: bool = False, pooled: bool | None = None):
+        """
+        Args:
+            database_name: name of connection data in file .dbs.crptjson
+            db_type: use class DBType for setting this parameter
+            echo: log all queries
+            pooled: keep open connections in QueuePool,
+                    if it is not set, pool is used when connection data have key POOL_SIZE
+        """
         self._db_name = database_name
-        # load crypt json which content data for connect to database
-        self._json_manager = JsonManagerWithCrypt(AddressType.CFILE, ".dbs.crptjson")
-        self._json_manager.load_from_file()
+        # get decrypted json which content data for connect to database
+        dbs_data = SecretsStore.get(".dbs.crptjson")
         # get data for connect to database by name which set in param database_name
         # structure of dict {
         # "DB_HOST": STR
@@ -39,21 +126,176 @@ class DBManager:
         # "DB_USER": STR
         # "DB_PASS": STR
         # "DB_NAME": STR
+        # optional settings of pool
+        # "POOL_SIZE": INT
+        # "MAX_OVERFLOW": INT
+        # "POOL_RECYCLE": INT (seconds)
+        # "POOL_TIMEOUT": INT (seconds)
+        # "POOL_PRE_PING": BOOL
 
-        data_for_conn: dict = self._json_manager.buffer.get(database_name)
-        if data_for_conn is None:
+        if dbs_data.get(database_name) is None:
             raise DatabaseNameError(database_name)
         else:
+            # copy read-only view, because the dict will be changed
+            data_for_conn: dict = dict(dbs_data[database_name])
             for par in ["DB_HOST", "DB_PORT", "DB_USER", "DB_PASS", "DB_NAME"]:
                 if data_for_conn.get(par) is None:
                     raise DatabaseConnectionDataError(database_name, par)
         data_for_conn["CONN_URL"] = db_type
         data_for_conn["DB_PASS"] = quote_plus(data_for_conn["DB_PASS"])
+        if pooled is None:
+            pooled = data_for_conn.get("POOL_SIZE") is not None
         conn_url = self.get_url_by_dict(data_for_conn)
-        self.Engine = create_engine(url=conn_url, echo=echo, poolclass=NullPool)
-        self.Session = sessionmaker(self.Engine)
+        pool_args = self.get_pool_args(data_for_conn, pooled)
+        engine_key = (database_name, db_type, conn_url, echo, tuple(pool_args.items()))
+        with self._engines_lock:
+            if engine_key not in self._engines:
+                self._dispose_stale_engines(database_name, db_type, conn_url)
+                engine = create_engine(url=conn_url, echo=echo, **pool_args)
+                self._engines[engine_key] = (engine, sessionmaker(engine))
+            self.Engine, self.Session = self._engines[engine_key]
         self.metadata_obj = MetaData()
 
+    @classmethod
+    def _dispose_stale_engines(cls, database_name: str, db_type: str, conn_url: str) -> None:
+        # connection data were changed in .dbs.crptjson, so connections with old data are closed
+        for key in [key for key in cls._engines if key[:2] == (database_name, db_type) and key[2] != conn_url]:
+            engine, _ = cls._engines.pop(key)
+            engine.dispose()
+
+    @staticmethod
+    def get_pool_args(data_for_conn: dict, pooled: bool) -> dict:
+        if not pooled:
+            return {"poolclass": NullPool}
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": data_for_conn.get("POOL_SIZE", 5),
+            "max_overflow": data_for_conn.get("MAX_OVERFLOW", 10),
+            "pool_recycle": data_for_conn.get("POOL_RECYCLE", 3600),
+            "pool_timeout": data_for_conn.get("POOL_TIMEOUT", 30),
+            "pool_pre_ping": data_for_conn.get("POOL_PRE_PING", True)
+        }
+
+    def pool_stats(self) -> dict:
+        """Statistics of the shared pool of connections"""
+        pool = self.Engine.pool
+        if not isinstance(pool, QueuePool):
+            return {"pooled": False}
+        stats = {
+            "pooled": True,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow()
+        }
+        if isinstance(pool, TimedQueuePool):
+            stats["checkouts"] = pool.checkouts
+            stats["wait_time"] = pool.wait_time
+            stats["max_wait_time"] = pool.max_wait_time
+            stats["avg_wait_time"] = pool.wait_time / pool.checkouts if pool.checkouts else 0.0
+        return stats
+
+    def define_table(self, name: str, columns: Dict[str, str],
+                     primary_key: str | List[str] | None = None) -> Table:
+        """
+        Create table on metadata_obj from compact spec
+
+        Args:
+            name: table name
+            columns: column names and their types from map_types, like {"user_id": "int_big", "xp": "int"}
+            primary_key: column name or list of column names
+        """
+        table = self.metadata_obj.tables.get(name)
+        if table is not None:
+            return table
+        if isinstance(primary_key, str):
+            primary_key = [primary_key]
+        primary_key = primary_key or []
+        table_columns = []
+        for column_name, type_name in columns.items():
+            column_type = map_types.get(type_name)
+            if column_type is None:
+                raise DatabaseColumnTypeError(name, column_name, type_name)
+            table_columns.append(Column(column_name, column_type, primary_key=column_name in primary_key))
+        return Table(name, self.metadata_obj, *table_columns)
+
+    def create_tables(self) -> None:
+        """Create all tables of metadata_obj which are not exist in db"""
+        self.metadata_obj.create_all(self.Engine)
+
+    @staticmethod
+    def _chunks(rows: Iterable[dict], chunk_size: int) -> Iterable[List[dict]]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def insert_many(self, table: Table, rows: Iterable[dict], chunk_size: int = 1000) -> int:
+        """
+        Insert rows by chunks, every chunk is one executemany
+
+        Returns count of inserted rows
+        """
+        count = 0
+        with self.Engine.begin() as conn:
+            for chunk in self._chunks(rows, chunk_size):
+                conn.execute(insert(table), chunk)
+                count += len(chunk)
+        return count
+
+    def upsert_many(self, table: Table, rows: Iterable[dict],
+                    update_columns: List[str] | None = None, chunk_size: int = 1000) -> int:
+        """
+        Insert rows or update them if primary key already exists
+
+        Uses ON DUPLICATE KEY UPDATE for MySQL/MariaDB and ON CONFLICT for SQLite/PostgreSQL
+
+        Args:
+            table: table from define_table
+            rows: dicts with the same keys
+            update_columns: columns which will be updated, by default all columns of row except primary key
+            chunk_size: count of rows in one executemany
+
+        Returns count of processed rows
+        """
+        primary_key = [column.name for column in table.primary_key.columns]
+        dialect = self.Engine.dialect.name
+        count = 0
+        with self.Engine.begin() as conn:
+            for chunk in self._chunks(rows, chunk_size):
+                columns = update_columns
+                if columns is None:
+                    columns = [column for column in chunk[0] if column not in primary_key]
+                if dialect in ("mysql", "mariadb"):
+                    stmt = mysql_insert(table)
+                    # updating primary key by itself changes nothing
+                    set_columns = columns or primary_key[:1]
+                    stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in set_columns})
+                elif dialect in ("sqlite", "postgresql"):
+                    stmt = sqlite_insert(table) if dialect == "sqlite" else postgresql_insert(table)
+                    if columns:
+                        stmt = stmt.on_conflict_do_update(index_elements=primary_key,
+                                                          set_={column: stmt.excluded[column] for column in columns})
+                    else:
+                        stmt = stmt.on_conflict_do_nothing(index_elements=primary_key)
+                else:
+                    raise DatabaseDialectError(dialect, "upsert")
+                conn.execute(stmt, chunk)
+                count += len(chunk)
+        return count
+
+    @classmethod
+    def dispose_engines(cls) -> None:
+        """Close all pooled connections of all databases"""
+        with cls._engines_lock:
+            for engine, _ in cls._engines.values():
+                engine.dispose()
+            cls._engines.clear()
+
     @staticmethod
     def get_url_by_dict(data_for_conn: dict) -> str:
         conn_address = data_for_conn["CONN_URL"].format(**data_for_conn)
@@ -78,15 +320,328 @@ class DBManager:
                 return res
         return wrapper
 
+    @staticmethod
+    def async_db_connect(func):
+        """
+        Decorator for func, which work with db and is called from coroutines
+
+        Func stays sync and runs in the db executor: await self.func(...)
+        """
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            def run():
+                with self.Engine.connect() as conn:
+                    return func(self, conn, *args, **kwargs)
+            return await run_in_db_executor(run)
+        return wrapper
+
+    @staticmethod
+    def async_db_session(func):
+        """
+        Decorator for func, which work with db session and is called from coroutines
+
+        Func stays sync and runs in the db executor: await self.func(...)
+        """
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            def run():
+                with self.Session() as session:
+                    return func(self, session, *args, **kwargs)
+            return await run_in_db_executor(run)
+        return wrapper
+
+
+class LiteDBWriter:
+    # writers by path of db file, one writer per file
+    _writers: Dict[str, "LiteDBWriter"] = {}
+    _writers_lock = Lock()
+
+    def __init__(self, db_path: str,
+                 batch_size: int = 500,
+                 flush_interval: float = 0.5,
+                 synchronous: str = "NORMAL",
+                 queue_size: int = 100000,
+                 read_connections: int = 4,
+                 cached_statements: int = 256):
+        """
+        Owner of the only write connection to SQLite file
+
+        Writes are queued and committed by a dedicated thread in batched transactions,
+        reads use a small pool of read-only connections. Db works in WAL journal mode.
+
+        Args:
+            db_path: path to db file
+            batch_size: max count of statements in one transaction
+            flush_interval: max seconds between queuing and committing a statement
+            synchronous: value of PRAGMA synchronous for the write connection
+            queue_size: max count of queued statements, callers wait when queue is full
+            read_connections: max count of read-only connections
+            cached_statements: size of cache of prepared statements for every connection
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self.max_read_connections = read_connections
+        # stats of writer
+        self.committed = 0
+        self.transactions = 0
+        self.errors = 0
+        self.last_error: Exception | None = None
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._readers: Queue = Queue()
+        self._readers_count = 0
+        self._readers_lock = Lock()
+        self._closed = False
+        ready = Event()
+        self._thread = Thread(target=self._run, args=(ready,), name=f"LiteDBWriter-{db_path}", daemon=True)
+        self._thread.start()
+        ready.wait()
+        # daemon thread is killed at exit, so queued statements are committed before it
+        atexit.register(self.close)
+
+    @classmethod
+    def get(cls, db_path: str, **params) -> "LiteDBWriter":
+        """Get shared writer for the db file"""
+        with cls._writers_lock:
+            writer = cls._writers.get(db_path)
+            if writer is None or writer.closed:
+                writer = cls(db_path, **params)
+                cls._writers[db_path] = writer
+            return writer
+
+    @classmethod
+    def close_all(cls) -> None:
+        """Commit queued statements of all writers and close them"""
+        with cls._writers_lock:
+            writers = list(cls._writers.values())
+            cls._writers.clear()
+        for writer in writers:
+            writer.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def execute(self, sql: str, params: tuple | dict = ()) -> None:
+        """Queue statement, it will be committed with the next batch"""
+        if self._closed:
+            raise DatabaseWriterClosedError(self.db_path)
+        self._queue.put((sql, params, False))
+
+    def executemany(self, sql: str, seq_of_params: Iterable[tuple | dict]) -> None:
+        """Queue statement for many params, it will be committed with the next batch"""
+        if self._closed:
+            raise DatabaseWriterClosedError(self.db_path)
+        self._queue.put((sql, list(seq_of_params), True))
+
+    def flush(self) -> None:
+        """Wait until all queued statements are committed"""
+        # closed writer has committed everything already
+        if self._closed:
+            return
+        done = Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        """Commit queued statements and close all connections"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except Empty:
+                break
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            conn.execute("PRAGMA query_only = ON")
+            return conn
+        # transactions are opened and committed by writer itself
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Take read-only connection from the pool"""
+        try:
+            conn = self._readers.get_nowait()
+        except Empty:
+            with self._readers_lock:
+                can_create = self._readers_count < self.max_read_connections
+                if can_create:
+                    self._readers_count += 1
+            conn = self._connect(read_only=True) if can_create else self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def _run(self, ready: Event) -> None:
+        conn = self._connect()
+        ready.set()
+        last_commit = monotonic()
+        batch: List[tuple] = []
+        while True:
+            # wait for the first item not longer than time left to the commit of the batch
+            timeout = max(self.flush_interval - (monotonic() - last_commit), 0.0) if batch else None
+            try:
+                items = [self._queue.get(timeout=timeout)]
+            except Empty:
+                items = []
+            # take queued items up to the batch size without waiting
+            while items and len(batch) + len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            stop = False
+            waiters: List[Event] = []
+            for item in items:
+                if item is None:
+                    stop = True
+                elif isinstance(item, Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+            try:
+                if batch and (stop or waiters or len(batch) >= self.batch_size
+                              or monotonic() - last_commit >= self.flush_interval):
+                    # batch is dropped even if it is failed, so the broken statement is not repeated forever
+                    try:
+                        self._commit(conn, batch)
+                    finally:
+                        batch = []
+                        last_commit = monotonic()
+            except Exception as e:
+                # thread must stay alive, else flush() and execute() will wait forever
+                self.errors += 1
+                self.last_error = e
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                conn.close()
+                return
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[tuple]) -> None:
+        conn.execute("BEGIN")
+        try:
+            for sql, params, many in batch:
+                try:
+                    self._execute_with_retry(conn, sql, params, many)
+                except sqlite3.Error as e:
+                    # error of one statement doesn't cancel the other statements of the batch
+                    self.errors += 1
+                    self.last_error = e
+                # statement like COMMIT or ROLLBACK could end the transaction of batch
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self.committed += len(batch)
+        self.transactions += 1
+
+    @staticmethod
+    def _execute_with_retry(conn: sqlite3.Connection, sql: str, params: tuple | dict | list, many: bool) -> None:
+        # db can be locked for a short time by another process, so the statement is repeated
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                if many:
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or not _is_busy_error(e):
+                    raise
+                sleep(BUSY_RETRY_DELAY * (attempt + 1))
+
 
 class LiteDBManager:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, write_behind: bool = False, **writer_params):
+        """
+        Args:
+            db_path: path to db file
+            write_behind: production mode, writes go through the shared LiteDBWriter
+                          in batched transactions and db_connect gives read-only connections
+            **writer_params: params of LiteDBWriter
+        """
         self._db_path = db_path
+        self._writer = LiteDBWriter.get(db_path, **writer_params) if write_behind else None
+
+    @property
+    def writer(self) -> LiteDBWriter | None:
+        return self._writer
+
+    def write(self, sql: str, params: tuple | dict = ()) -> None:
+        """Execute writing statement, in write-behind mode it is only queued"""
+        if self._writer is not None:
+            self._writer.execute(sql, params)
+            return
+        with sqlite3.connect(self._db_path) as conn:
+            conn.execute(sql, params)
+
+    def write_many(self, sql: str, seq_of_params: Iterable[tuple | dict]) -> None:
+        """Execute writing statement for many params, in write-behind mode it is only queued"""
+        if self._writer is not None:
+            self._writer.executemany(sql, seq_of_params)
+            return
+        with sqlite3.connect(self._db_path) as conn:
+            conn.executemany(sql, seq_of_params)
+
+    def flush(self) -> None:
+        """Wait until all queued writes are committed"""
+        if self._writer is not None:
+            self._writer.flush()
 
     @staticmethod
     def db_connect(func):
         def wrapper(self, *args, **kwargs):
+            if self._writer is not None:
+                with self._writer.read_connection() as conn:
+                    return func(self, conn, *args, **kwargs)
             with sqlite3.connect(self._db_path) as conn:
                 res = func(self, conn, *args, **kwargs)
                 return res
+        return wrapper
+
+    @staticmethod
+    def async_db_connect(func):
+        """
+        Decorator for func, which work with db and is called from coroutines
+
+        Func stays sync and runs in the db executor: await self.func(...)
+        """
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            def run():
+                if self._writer is not None:
+                    with self._writer.read_connection() as read_conn:
+                        return func(self, read_conn, *args, **kwargs)
+                # connection is created in the thread where it is used
+                conn = sqlite3.connect(self._db_path)
+                try:
+                    with conn:
+                        return func(self, conn, *args, **kwargs)
+                finally:
+                    conn.close()
+            return await run_in_db_executor(run)
         return wrapper
\ No newline at end of file
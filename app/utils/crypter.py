@@ -3,9 +3,15 @@ from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.fernet import Fernet
 from string import ascii_letters, digits
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+from multiprocessing import get_context
 from json import loads, dumps
-from os import urandom
+from typing import Dict, Callable, Any
+from threading import Lock
+from os import urandom, cpu_count
+import asyncio
 import hashlib
+import hmac
 from random import randint
 
 
@@ -13,6 +19,48 @@ from random import randint
 SYM_IDS = ascii_letters + digits
 SYM_LEN = len(SYM_IDS) - 1
 
+# hashlib and OpenSSL release GIL, so threads are enough for them
+CRYPTO_THREAD_WORKERS = min(8, (cpu_count() or 1) + 2)
+# RSA key generation holds the process for a long time, so it runs in other processes
+CRYPTO_PROCESS_WORKERS = min(4, cpu_count() or 1)
+
+
+class CryptoExecutor:
+    """
+    Shared bounded pools for crypto functions which are called from coroutines
+
+    THREAD for hashing and symmetric encryption, PROCESS for RSA key generation
+    """
+    THREAD = "thread"
+    PROCESS = "process"
+
+    _executors: Dict[str, Executor] = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, kind: str = THREAD) -> Executor:
+        with cls._lock:
+            executor = cls._executors.get(kind)
+            if executor is None:
+                if kind == cls.PROCESS:
+                    # spawn, because fork of the process with threads can copy locked locks
+                    executor = ProcessPoolExecutor(max_workers=CRYPTO_PROCESS_WORKERS, mp_context=get_context("spawn"))
+                else:
+                    executor = ThreadPoolExecutor(max_workers=CRYPTO_THREAD_WORKERS, thread_name_prefix="crypto")
+                cls._executors[kind] = executor
+            return executor
+
+    @classmethod
+    async def run(cls, kind: str, func: Callable, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(cls.get(kind), func, *args)
+
+    @classmethod
+    def shutdown(cls, wait: bool = True) -> None:
+        with cls._lock:
+            for executor in cls._executors.values():
+                executor.shutdown(wait=wait)
+            cls._executors.clear()
+
 
 def gen_random_line(len_id: int = 8) -> str:
     result = "".join([SYM_IDS[randint(0, SYM_LEN)] for _ in range(len_id)])
@@ -66,6 +114,20 @@ class CrypterConvertor:
         result = loads(result_in_str)
         return result
 
+    # async methods, they run the same sync methods in the crypto thread pool
+
+    async def async_encrypt(self, data: bytes) -> bytes:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.encrypt, data)
+
+    async def async_decrypt(self, data: bytes) -> bytes:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.decrypt, data)
+
+    async def async_dict_encrypt(self, dict_for_encrypt: dict) -> bytes:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.dict_encrypt, dict_for_encrypt)
+
+    async def async_dict_decrypt(self, dict_for_decrypt: bytes) -> dict:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.dict_decrypt, dict_for_decrypt)
+
 
 class Crypter(CrypterConvertor):
     def __init__(self, crypt_key: bytes, encoding: str = "latin1"):
@@ -94,6 +156,25 @@ class Crypter(CrypterConvertor):
         return decrypt_data
 
 
+_crypters: Dict[tuple, Crypter] = {}
+
+
+def get_crypter(crypt_key: bytes, encoding: str = "latin1") -> Crypter:
+    """Get shared Crypter for the key, Fernet object is built once per key"""
+    crypter = _crypters.get((crypt_key, encoding))
+    if crypter is None:
+        crypter = Crypter(crypt_key=crypt_key, encoding=encoding)
+        _crypters[(crypt_key, encoding)] = crypter
+    return crypter
+
+
+def _generate_private_pem(key_size: int) -> bytes:  # it runs in other process, so key is returned as PEM
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size, backend=default_backend())
+    return private_key.private_bytes(encoding=serialization.Encoding.PEM,
+                                     format=serialization.PrivateFormat.PKCS8,
+                                     encryption_algorithm=serialization.NoEncryption())
+
+
 class AsymmetricCrypter(CrypterConvertor):
     def __init__(self, private_key: rsa.RSAPrivateKey | None = None,
                  public_key: rsa.RSAPublicKey | None = None,
@@ -132,6 +213,12 @@ class AsymmetricCrypter(CrypterConvertor):
         )
         self.__public_key = self.__private_key.public_key()
 
+    async def async_generate_keys(self, key_size: int = 2048) -> None:
+        """Generate a pair of asymmetric keys in the crypto process pool"""
+        private_pem = await CryptoExecutor.run(CryptoExecutor.PROCESS, _generate_private_pem, key_size)
+        self.__private_key = serialization.load_pem_private_key(private_pem, password=None)
+        self.__public_key = self.__private_key.public_key()
+
     def encrypt(self, data: bytes) -> bytes:
         """ Func for encrypt bytes
         Scheme
@@ -178,3 +265,30 @@ class Hasher:
     def data_hex_hash(self, data: str, iters: int = 100, encoding: str | None = None):
         enc = self.encoding if encoding is None else encoding
         return self.data_hash(data.encode(enc), iters).hex()
+
+    async def async_data_hash(self, data: bytes, iters: int = 100) -> bytes:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.data_hash, data, iters)
+
+    async def async_data_hex_hash(self, data: str, iters: int = 100, encoding: str | None = None) -> str:
+        return await CryptoExecutor.run(CryptoExecutor.THREAD, self.data_hex_hash, data, iters, encoding)
+
+
+class Signer:
+    def __init__(self, key: bytes, hash_name: str = "sha256"):
+        """
+        Class for signing raw bytes with HMAC
+
+        Args:
+            key: secret key, it is derived once and used for all messages
+            hash_name: name of hash function
+        """
+        self.key = key
+        self.hash_name = hash_name
+
+    def sign(self, data: bytes) -> str:
+        return hmac.digest(self.key, data, self.hash_name).hex()
+
+    def is_valid(self, data: bytes, signature: str) -> bool:
+        """Check signature in the constant time"""
+        # signature is sent by client, str with non-ascii chars can't be compared by compare_digest
+        return hmac.compare_digest(self.sign(data).encode(), signature.encode("latin1", "replace"))
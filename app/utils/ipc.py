@@ -0,0 +1,155 @@
+from app.factory.errors import IPCError
+from app.utils.logger import Logger
+from typing import Any, Callable, Dict
+from json import dumps, loads
+from os import remove
+from os.path import exists, dirname
+from pathlib import Path
+import asyncio
+
+
+# max size of one message in bytes
+IPC_LIMIT = 2 ** 24
+
+
+class IPCServer:
+    def __init__(self, path: str, log: Logger | None = None):
+        """
+        Server of json lines calls over the unix socket
+
+        Request is {"id": 1, "method": "name", "params": {...}}, answer is {"id": 1, "result": ...}
+        or {"id": 1, "error": "text"}. Request without id is a notification, it has no answer.
+
+        Args:
+            path: path of the unix socket
+            log: logger for errors of handlers
+        """
+        self.path = path
+        self.log = log
+        self._handlers: Dict[str, Callable] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+    def register(self, name: str, handler: Callable) -> None:
+        """Add handler, it can be function or coroutine function with keyword params"""
+        self._handlers[name] = handler
+
+    async def start(self) -> None:
+        Path(dirname(self.path)).mkdir(parents=True, exist_ok=True)
+        if exists(self.path):
+            remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_client, path=self.path, limit=IPC_LIMIT)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if exists(self.path):
+            remove(self.path)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                request = loads(line)
+                answer = await self._call(request)
+                if "id" in request:
+                    answer["id"] = request["id"]
+                    writer.write(dumps(answer).encode() + b"\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # server is stopped with the event loop
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, request: dict) -> dict:
+        handler = self._handlers.get(request.get("method"))
+        if handler is None:
+            return {"error": f"Unknown method {request.get('method')}"}
+        try:
+            result = handler(**(request.get("params") or {}))
+            if asyncio.iscoroutine(result):
+                result = await result
+            return {"result": result}
+        except Exception as error:
+            if self.log is not None:
+                self.log.error("IPC method %s failed: %s", request.get("method"), error)
+            return {"error": str(error)}
+
+
+class IPCClient:
+    def __init__(self, path: str, timeout: float = 10.0):
+        """
+        Client of IPCServer, calls of all coroutines are sent over one connection
+
+        Connection is opened with the first call in the running event loop and opened again after errors.
+
+        Args:
+            path: path of the unix socket
+            timeout: seconds for the waiting of answer
+        """
+        self.path = path
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock: asyncio.Lock | None = None
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=IPC_LIMIT)
+                self._reader_task = asyncio.get_running_loop().create_task(self._read_answers(self._reader))
+        return self._writer
+
+    async def _read_answers(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                answer = loads(line)
+                waiter = self._waiters.pop(answer.get("id"), None)
+                if waiter is None or waiter.done():
+                    continue
+                if "error" in answer:
+                    waiter.set_exception(IPCError(answer["error"]))
+                else:
+                    waiter.set_result(answer.get("result"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # answers for the sent calls will not come
+            self._writer = None
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(IPCError("Connection to IPC server was closed"))
+            self._waiters.clear()
+
+    async def call(self, method: str, **params: Any) -> Any:
+        """Call method of server and wait for the result"""
+        writer = await self._connect()
+        self._next_id += 1
+        call_id = self._next_id
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[call_id] = waiter
+        writer.write(dumps({"id": call_id, "method": method, "params": params}).encode() + b"\n")
+        try:
+            return await asyncio.wait_for(waiter, self.timeout)
+        finally:
+            self._waiters.pop(call_id, None)
+
+    async def notify(self, method: str, **params: Any) -> None:
+        """Call method of server without waiting for the result"""
+        writer = await self._connect()
+        writer.write(dumps({"method": method, "params": params}).encode() + b"\n")
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
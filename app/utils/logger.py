@@ -1,9 +1,15 @@
-from app.utils.ujson import JsonManager
+from app.utils.ujson import JsonRegistry
 from sys import stdout, path as sys_path
 from colorama import init, Fore, Style
+from queue import Queue, Empty, Full
+from threading import Thread, Event
 from datetime import datetime
-from typing import TextIO
+from typing import TextIO, List, Tuple, Callable, Any
+from string import Formatter
 from pathlib import Path
+from time import monotonic, time
+from json import dumps
+import atexit
 
 
 launch_path = sys_path[1]
@@ -18,6 +24,8 @@ class LogType:
     WARN = 2
     ERROR = 3
     FATAL = 4
+    # severity of every log type, DEBUG is the lowest one
+    SEVERITY = (1, 0, 2, 3, 4)
 
 
 class Colors:
@@ -36,30 +44,241 @@ class Colors:
     color_line = ["{line}", "{line}", "{line}", "{line}", f"{Fore.RED}{{line}}{Fore.RESET}"]
 
 
+class OverflowPolicy:
+    """
+    What LogFileSink does when its queue is full
+    """
+    # wait until the writer thread frees space in the queue
+    BLOCK = "block"
+    # skip the note and count it in LogFileSink.dropped
+    DROP = "drop"
+
+
+class LogFileSink:
+    def __init__(self, name: str, path: str, encoding: str,
+                 header: str = "",
+                 suffix: str = ".txt",
+                 queue_size: int = 10000,
+                 batch_size: int = 256,
+                 flush_interval: float = 1.0,
+                 overflow_policy: str = OverflowPolicy.BLOCK):
+        """
+        Background writer of log files
+
+        Notes are put to a bounded queue and written by a daemon thread in batches.
+        The file of the current day is kept open until the date changes.
+
+        Args:
+            name: logger name, prefix of log files
+            path: directory for log files
+            encoding: encoding of log files
+            header: first line of every new log file
+            suffix: extension of log files
+            queue_size: max count of notes waiting for writing
+            batch_size: count of written notes after which file is flushed
+            flush_interval: max seconds between writing a note and flushing the file
+            overflow_policy: use class OverflowPolicy for setting this parameter
+        """
+        self.name = name
+        self.path = path
+        self.encoding = encoding
+        self.header = header
+        self.suffix = suffix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        # errors of writing, writer thread keeps working after them
+        self.errors = 0
+        self.last_error: Exception | None = None
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._file: TextIO | None = None
+        self._date: str | None = None
+        self._closed = False
+        self._thread = Thread(target=self._run, name=f"LogFileSink-{name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, date: str, line: str) -> None:
+        """Add note for the log file of the date"""
+        if self._closed:
+            return
+        # without the writer thread the blocking put would wait forever
+        if self.overflow_policy == OverflowPolicy.DROP or not self._thread.is_alive():
+            try:
+                self._queue.put_nowait((date, line))
+            except Full:
+                self.dropped += 1
+        else:
+            self._queue.put((date, line))
+
+    def flush(self) -> None:
+        """Wait until all queued notes are written to the file"""
+        if self._closed:
+            return
+        done = Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        """Write all queued notes, close the file and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _open(self, date: str) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            # file is opened again with the next note, if opening fails
+            self._date = None
+        Path(self.path).mkdir(parents=True, exist_ok=True)
+        # file is appended, so the new sink (for example, after close) doesn't erase notes of the day
+        self._file = open(f"{self.path}{self.name}_{date}{self.suffix}", "a", encoding=self.encoding)
+        if self.header and self._file.tell() == 0:
+            self._file.write(self.header)
+        self._date = date
+
+    def _write(self, date: str, lines: List[str]) -> None:
+        if self._date != date:
+            self._open(date)
+        self._file.write("".join(lines))
+
+    def _run(self) -> None:
+        unflushed = 0
+        last_flush = monotonic()
+        while True:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except Empty:
+                items = []
+            # take queued items up to the batch size without waiting
+            while items and len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            stop = False
+            waiters: List[Event] = []
+            notes: List[Tuple[str, str]] = []
+            for item in items:
+                if item is None:
+                    stop = True
+                elif isinstance(item, Event):
+                    waiters.append(item)
+                else:
+                    notes.append(item)
+            try:
+                unflushed += self._write_notes(notes)
+                now = monotonic()
+                if unflushed and (stop or waiters or unflushed >= self.batch_size
+                                  or now - last_flush >= self.flush_interval):
+                    unflushed = 0
+                    last_flush = now
+                    self._file.flush()
+            except Exception as e:
+                # notes of the failed batch are lost, but thread keeps draining the queue,
+                # else put() with the blocking policy would wait forever
+                self.errors += 1
+                self.last_error = e
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                if self._file is not None:
+                    try:
+                        self._file.close()
+                    except OSError:
+                        pass
+                    self._file = None
+                return
+
+    def _write_notes(self, notes: List[Tuple[str, str]]) -> int:
+        """Write notes to the files of their dates, returns count of written notes"""
+        lines: List[str] = []
+        lines_date = None
+        count = 0
+        for date, line in notes:
+            # write collected lines before the rotation of the file
+            if lines_date is not None and lines_date != date:
+                self._write(lines_date, lines)
+                count += len(lines)
+                lines = []
+            lines_date = date
+            lines.append(line if line.endswith("\n") else line + "\n")
+        if lines:
+            self._write(lines_date, lines)
+            count += len(lines)
+        return count
+
+
+class OutputMode:
+    """
+    Which log files Logger writes (key "output_mode" in logger_conf.json)
+    """
+    # text lines in {name}_{date}.txt
+    TEXT = "text"
+    # one json object per line in {name}_{date}.jsonl
+    JSON = "json"
+    # both files
+    BOTH = "both"
+
 
 class Logger:
-    def __init__(self, name: str, debug_mode: bool = None,  out_stream: TextIO = None):
+    def __init__(self, name: str, debug_mode: bool = None,  out_stream: TextIO = None,
+                 level: int | None = None):
         """
         Class for logging all info with timestamps, file saving and coloring
         Args:
             name: this is a prefix, which logger will use
             debug_mode: if logger need to skip DEBUG message
+            level: min log type for printing, overrides debug_mode (use class LogType)
 
         """
 
         # get conf to logger
-        self.cfg = JsonManager("logger_conf.json")
-        self.cfg.load_from_file()
+        self.cfg = JsonRegistry.get("logger_conf.json")
         # bind out stream
         self.out_stream = out_stream
         if out_stream is None:
             self.out_stream = stdout.orig_out_stream if isinstance(stdout, PrintHandler) else stdout
         # init class data, prefix
-        self._debug_mode = debug_mode
+        self._enabled: List[bool] = []
+        self._level = LogType.DEBUG
+        self.debug_mode = debug_mode
+        if level is not None:
+            self.level = level
         self.name = name
-        self.__old_date = ""
-        self.__path_to_log_file = ""
+        self._sink: LogFileSink | None = None
+        self._json_sink: LogFileSink | None = None
+        output_mode = self.cfg["output_mode"] or OutputMode.TEXT
+        self._text_output = output_mode in (OutputMode.TEXT, OutputMode.BOTH)
+        self._json_output = output_mode in (OutputMode.JSON, OutputMode.BOTH)
+        # constant beginning of json records for every log type
+        self._json_prefixes = ['{"logger":%s,"level":"%s","ts":' % (dumps(self.name), log_type.strip())
+                               for log_type in Colors.log_types]
         self.msg_format = self.cfg["msg_format"] + Fore.RESET
+        # precompiled formats for every log type, only time and line are left in them
+        self._color_formats = [self.__compile_format(Colors.time,
+                                                     Colors.name.format(name=self.name),
+                                                     Colors.color_log_types[log_type],
+                                                     Colors.color_line[log_type])
+                               for log_type in range(len(Colors.log_types))]
+        self._plain_formats = [self.__compile_format("{now_time}", self.name, Colors.log_types[log_type], "{line}")
+                               for log_type in range(len(Colors.log_types))]
+        # date and time strings are cached per second
+        self._cache_time_strings = "%f" not in self.cfg["time_format"]
+        self._cached_second = -1
+        self._cached_date = ""
+        self._cached_time = ""
 
         init()
 
@@ -73,82 +292,193 @@ class Logger:
     @debug_mode.setter
     def debug_mode(self, value: bool):
         self._debug_mode = value
+        # debug_mode which is not set keeps DEBUG messages
+        self.level = LogType.INFO if value is False else LogType.DEBUG
+
+    @property
+    def level(self) -> int:
+        return self._level
+
+    @level.setter
+    def level(self, value: int):
+        self._level = value
+        min_severity = LogType.SEVERITY[value]
+        self._enabled = [severity >= min_severity for severity in LogType.SEVERITY]
+
+    def is_enabled_for(self, log_type: int) -> bool:
+        return self._enabled[log_type]
 
     @staticmethod
-    def __get_str_datetime(time, datetime_format: str) -> str:
-        return time.strftime(datetime_format)
+    def __escape(line: str) -> str:
+        return line.replace("{", "{{").replace("}", "}}")
+
+    def __compile_format(self, time_format: str, name: str, log_type: str, line_format: str) -> str:
+        """
+        Put constant parts into msg_format
+
+        Args:
+            time_format: format with field {now_time}
+            name: logger name
+            log_type: log type prefix
+            line_format: format with field {line}
+        """
+        const_fields = {"name": self.__escape(name), "log_type": self.__escape(log_type),
+                        "now_time": time_format, "line": line_format}
+        result = ""
+        for literal, field, spec, conversion in Formatter().parse(self.msg_format):
+            result += self.__escape(literal)
+            if field is None:
+                continue
+            if field in const_fields and not spec and not conversion:
+                result += const_fields[field]
+            else:
+                result += "{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+        return result
+
+    def __get_str_datetime(self) -> Tuple[float, str, str]:  # get timestamp, date and time for the note
+        now = time()
+        second = int(now)
+        if second != self._cached_second or not self._cache_time_strings:
+            now_datetime = datetime.fromtimestamp(now)
+            self._cached_date = now_datetime.strftime(self.cfg["date_format"])
+            self._cached_time = now_datetime.strftime(self.cfg["time_format"])
+            self._cached_second = second
+        return now, self._cached_date, self._cached_time
+
+    def __create_sink(self, header: str, suffix: str) -> LogFileSink:
+        return LogFileSink(name=self.name,
+                           path=f"{launch_path}/{self.cfg['default_path']}",
+                           encoding=self.cfg["encoding"],
+                           header=header,
+                           suffix=suffix,
+                           queue_size=self.cfg["queue_size"] or 10000,
+                           batch_size=self.cfg["batch_size"] or 256,
+                           flush_interval=self.cfg["flush_interval"] or 1.0,
+                           overflow_policy=self.cfg["overflow_policy"] or OverflowPolicy.BLOCK)
+
+    @property
+    def sink(self) -> LogFileSink:
+        # create writer of log files with the first note
+        if self._sink is None or self._sink.closed:
+            self._sink = self.__create_sink(f"Logger version | Log of module --> {self.name}\n", ".txt")
+        return self._sink
+
+    @property
+    def json_sink(self) -> LogFileSink:
+        # create writer of json lines files with the first record
+        if self._json_sink is None or self._json_sink.closed:
+            self._json_sink = self.__create_sink("", ".jsonl")
+        return self._json_sink
 
     # add note to file
     def __add_note(self, line: str, new_date: str | None):
-        # check if change the date
-        if self.__old_date != new_date:
-            # create new file
-            fullpath = f"{launch_path}/{self.cfg['default_path']}"
-            Path(fullpath).mkdir(parents=True, exist_ok=True)
-            self.__path_to_log_file = f"{fullpath}{self.name}_{new_date}.txt"
-            with open(self.__path_to_log_file, "w", encoding=self.cfg["encoding"]) as file:
-                file.write(f"Logger version | Log of module --> {self.name}\n")
-            self.__old_date = new_date
-        # write a note to the file
-        with open(self.__path_to_log_file, "a", encoding=self.cfg["encoding"]) as file:
-            file.write(line)
+        self.sink.put(new_date, line)
+
+    def __add_records(self, lines: Tuple[str, ...], log_type: int, now: float,
+                      new_date: str, extra: dict | None):
+        # json records are joined from parts without str.format
+        prefix = self._json_prefixes[log_type] + repr(round(now, 3)) + ',"msg":'
+        suffix = "}"
+        if extra:
+            suffix = "," + dumps(extra, default=str, separators=(",", ":"))[1:]
+        self.json_sink.put(new_date, "\n".join([prefix + dumps(line) + suffix for line in lines]))
+
+    def flush(self):
+        """Wait until all notes are written to the log files"""
+        for sink in (self._sink, self._json_sink):
+            if sink is not None:
+                sink.flush()
+
+    def close(self):
+        """Write all notes and close the log files"""
+        for sink in (self._sink, self._json_sink):
+            if sink is not None:
+                sink.close()
 
     def printf(self,
                line: str,
                log_type: int = 0,
                end: str = "\n",
                watermark: bool = True,
-               log_text_in_file: bool = True):
+               log_text_in_file: bool = True,
+               extra: dict | None = None):
         """ PRINT ONE LINE """
-        now_int_time = datetime.now()
-        now_date = self.__get_str_datetime(now_int_time, self.cfg["date_format"])
-        now_time = self.__get_str_datetime(now_int_time, self.cfg["time_format"])
-        # generate timestamp
+        if not self._enabled[log_type]:
+            return
+        self.__print_lines((line,), log_type, end, watermark, log_text_in_file, extra)
+
+    def println(self,
+                *lines: str,
+                log_type: int = 0,
+                end: str = "\n",
+                watermark: bool = True,
+                log_text_in_file: bool = True,
+                extra: dict | None = None):
+        """ PRINT MANY LINES"""
+        if lines and self._enabled[log_type]:
+            self.__print_lines(lines, log_type, end, watermark, log_text_in_file, extra)
+
+    def __print_lines(self, lines: Tuple[str, ...], log_type: int, end: str,
+                      watermark: bool, log_text_in_file: bool, extra: dict | None = None):
+        now, now_date, now_time = self.__get_str_datetime()
+        # generate color text
         if watermark:
-            # generate color text
-            c_line = self.msg_format.format(now_time=Colors.time.format(now_time=now_time),
-                                            name=Colors.name.format(name=self.name),
-                                            log_type=Colors.color_log_types[log_type],
-                                            line=Colors.color_line[log_type].format(line=line))
+            c_format = self._color_formats[log_type]
+            c_lines = [c_format.format(now_time=now_time, line=line) for line in lines]
         else:
-            c_line = Colors.color_line[log_type].format(line=line)
-        print(c_line, file=self.out_stream, end=end)
+            c_format = Colors.color_line[log_type]
+            c_lines = [c_format.format(line=line) for line in lines]
+        print(end.join(c_lines), file=self.out_stream, end=end)
         # need to save note in file
-        if log_text_in_file:
+        if not log_text_in_file:
+            return
+        if self._json_output:
+            self.__add_records(lines, log_type, now, now_date, extra)
+        if self._text_output:
             # generate text without ansi color
             if watermark:
-                f_line = self.msg_format.format(now_time=now_time,
-                                                name=self.name,
-                                                log_type=Colors.log_types[log_type],
-                                                line=line
-                                                )
+                f_format = self._plain_formats[log_type]
+                f_lines = [f_format.format(now_time=now_time, line=line) for line in lines]
             else:
-                f_line = line
+                f_lines = lines
             # add text to file
-            self.__add_note(f_line, now_date)
+            self.__add_note("\n".join(f_lines), now_date)
 
-    def println(self,
-                *lines: str,
-                log_type: int = 0,
-                end: str = "\n",
-                watermark: bool = True,
-                log_text_in_file: bool = True):
-        """ PRINT MANY LINES"""
-        for line in lines:
-            self.printf(line, log_type=log_type, end=end, watermark=watermark, log_text_in_file=log_text_in_file)
+    def log(self, log_type: int, line: str | Callable[[], str], *args: Any,
+            log_text_in_file: bool = True, extra: dict | None = None):
+        """
+        Print line only if log type is enabled
 
-    def info(self, line: str, log_text_in_file: bool = True):
-        self.printf(line, LogType.INFO, log_text_in_file=log_text_in_file)
+        Line is formatted lazily: line % args, or line() if line is callable.
+        Extra fields (guild id, command name, latency...) are saved only in json records
+        """
+        if not self._enabled[log_type]:
+            return
+        if callable(line):
+            line = line()
+        elif args:
+            line = line % args
+        self.__print_lines((line,), log_type, "\n", True, log_text_in_file, extra)
+
+    def debug(self, line: str | Callable[[], str], *args: Any,
+              log_text_in_file: bool = True, extra: dict | None = None):
+        self.log(LogType.DEBUG, line, *args, log_text_in_file=log_text_in_file, extra=extra)
 
-    def warn(self, line: str, log_text_in_file: bool = True):
-        self.printf(line, LogType.WARN, log_text_in_file=log_text_in_file)
+    def info(self, line: str | Callable[[], str], *args: Any,
+             log_text_in_file: bool = True, extra: dict | None = None):
+        self.log(LogType.INFO, line, *args, log_text_in_file=log_text_in_file, extra=extra)
 
-    def error(self, line: str, log_text_in_file: bool = True):
-        self.printf(line, LogType.ERROR, log_text_in_file=log_text_in_file)
+    def warn(self, line: str | Callable[[], str], *args: Any,
+             log_text_in_file: bool = True, extra: dict | None = None):
+        self.log(LogType.WARN, line, *args, log_text_in_file=log_text_in_file, extra=extra)
 
-    def critical(self, line: str, log_text_in_file: bool = True):
-        self.printf(line, LogType.FATAL, log_text_in_file=log_text_in_file)
+    def error(self, line: str | Callable[[], str], *args: Any,
+              log_text_in_file: bool = True, extra: dict | None = None):
+        self.log(LogType.ERROR, line, *args, log_text_in_file=log_text_in_file, extra=extra)
 
+    def critical(self, line: str | Callable[[], str], *args: Any,
+                 log_text_in_file: bool = True, extra: dict | None = None):
+        self.log(LogType.FATAL, line, *args, log_text_in_file=log_text_in_file, extra=extra)
 
 
 class PrintHandler:
@@ -175,7 +505,8 @@ class PrintHandler:
         pass
 
     def write(self, message: str | bytes):
-        if not message:
+        # skip formatting of the messages which will not be printed
+        if not message or not self.log.is_enabled_for(LogType.DEBUG):
             return
         if type(message) is bytes:
             message = message.decode()
@@ -1,6 +1,9 @@
-from app.utils.ujson import JsonManager
+from app.utils.ujson import JsonRegistry, JsonManager
 from app.utils.logger import Logger
-from typing import List, Dict, Coroutine
+from app.utils.templates import Template
+from app.utils.watcher import ConfigWatcher
+from app.utils.DB.dbmanager import LiteDBWriter
+from typing import List, Dict, Coroutine, Any, Mapping, Iterable
 from disnake import Embed, ButtonStyle
 from disnake.ext import commands
 from time import time
@@ -22,9 +25,99 @@ class SmartBot(commands.Bot):
         self.start_time = time()
         self.name = name
         self._async_tasks_for_queue: List[Coroutine] = []
-        self.props = JsonManager("bot_properties.json")
-        self.props.load_from_file()
+        self.props = JsonRegistry.get("bot_properties.json")
         self.log = Logger(name=name)
+        # typed map of dynamic config values, it is set by cog DynamicConfig
+        self.dynamic_config: Any = None
+        # templates of phrases and embeds, they are compiled at start and after the reloading of props file
+        self._templates: Dict[str, Any] = {}
+        self.compile_templates()
+        # reload changed configs without restarting of the bot
+        self.watcher = ConfigWatcher(self.log, interval=self.props["config_watch_interval"] or 0.5)
+        self._cmds_props = self.props["cmds"]
+        self.watcher.watch(self.props, self._on_props_reload)
+
+    def _on_props_reload(self, props: JsonManager) -> None:
+        # section dynamic_config is not in the file, so it is put again for the props["dynamic_config/..."] lookups
+        if self.dynamic_config is not None:
+            self.dynamic_config.inject_into_props()
+        # commands are built with the cogs, so cogs are loaded again if their commands were changed
+        cmds_props = props["cmds"] or {}
+        if cmds_props != self._cmds_props:
+            old_cmds_props, self._cmds_props = self._cmds_props or {}, cmds_props
+            changed_names = set()
+            for key in set(old_cmds_props).union(cmds_props):
+                old, new = old_cmds_props.get(key), cmds_props.get(key)
+                # only old name is known by the loaded cogs, new key is not used by them yet
+                if old != new and old is not None:
+                    changed_names.add(old.get("name"))
+            for extension in self._extensions_with_commands(changed_names):
+                self.log.info("Reloading extension %s", extension)
+                self.reload_extension(extension)
+        # errors in the new templates are shown at once
+        self._recompile_templates()
+
+    def _extensions_with_commands(self, names: Iterable[str]) -> List[str]:
+        """Names of extensions whose cogs have slash commands or sub commands with these names"""
+        names = set(names)
+        modules = {module.__name__: extension for extension, module in self.extensions.items()}
+        extensions = []
+        for cog in self.cogs.values():
+            extension = modules.get(type(cog).__module__)
+            if extension is None or extension in extensions:
+                continue
+            if names.intersection(self.__command_names(cog.get_application_commands())):
+                extensions.append(extension)
+        return extensions
+
+    @staticmethod
+    def __command_names(app_commands: Iterable[Any]) -> List[str]:
+        names = []
+        for command in app_commands:
+            names.append(command.name)
+            # sub commands and groups of slash command
+            names += SmartBot.__command_names(getattr(command, "children", {}).values())
+        return names
+
+    def compile_templates(self) -> None:
+        """
+        Parse all phrases and embeds from props, errors in the templates are raised at once
+
+        Runtime writes to props (like dynamic_config values) don't recompile templates,
+        so code which changes phrases or embeds in props must call this method itself
+        """
+        templates = {}
+        for section in ("def_phrases", "phrases"):
+            # declared variables of phrases, using another variable in the phrase is an error
+            section_vars = self.props[f"phrase_vars/{section}"] or {}
+            for key, line in (self.props[section] or {}).items():
+                path = f"{section}/{key}"
+                templates[path] = Template(line, variables=section_vars.get(key), name=path)
+        for key, cfg in (self.props["embeds"] or {}).items():
+            path = f"embeds/{key}"
+            templates[path] = EmbedTemplate(cfg, variables=cfg.get("vars"), name=path)
+        self._templates = templates
+
+    def _recompile_templates(self) -> None:
+        # broken templates are reported here, commands keep using the previous ones
+        try:
+            self.compile_templates()
+        except (KeyError, ValueError) as error:
+            self.log.error("Templates are not recompiled, previous ones are used: %s", error)
+
+    def _get_template(self, path: str) -> Any:
+        template = self._templates.get(path)
+        if template is None:
+            raise KeyError(path)
+        return template
+
+    def phrase(self, path: str, **dyn_vars: Any) -> str:
+        """Render phrase from props, like props["def_phrases/ping"].format(**dyn_vars)"""
+        return self._get_template(path).render(dyn_vars)
+
+    def embed(self, path: str, **dyn_vars: Any) -> "SmartEmbed":
+        """Render embed from props by path like embeds/name"""
+        return self._get_template(path).render(dyn_vars)
 
     def add_async_task(self, target: Coroutine) -> None:
         self._async_tasks_for_queue.append(target)
@@ -33,47 +126,127 @@ class SmartBot(commands.Bot):
         await asyncio.gather(*self._async_tasks_for_queue)
 
     async def on_ready(self):
+        self.watcher.start()
         end_time = time()
         delta_time = ((end_time - self.start_time) // 0.0001) / 10000
-        self.log.println(*self.props["def_phrases/start"]
-                         .format(user=self.user, during_time=delta_time)
+        self.log.println(*self.phrase("def_phrases/start", user=self.user, during_time=delta_time)
                          .split("\n"))
         await asyncio.create_task(self.start_async_tasks())
 
+    async def close(self) -> None:
+        self.watcher.stop()
+        await super().close()
+        # commit statements which are still in the queues of sqlite writers
+        LiteDBWriter.close_all()
+        # write all notes which are still in the queue of the log writer
+        self.log.close()
+
     async def on_command_error(self,
                                context: commands.Context,
                                exception: commands.errors.CommandError) -> None:
-        self.log.warn("Ignoring command -> %s" % context.message.content, log_text_in_file=False)
+        self.log.warn("Ignoring command -> %s", context.message.content, log_text_in_file=False)
+
+
+class EmbedTemplate:
+    # methods of Embed for the extra parts of embed config
+    EXTRA_PARTS = ("thumbnail", "author", "footer", "image")
+
+    def __init__(self, cfg: dict, variables: Iterable[str] | None = None, name: str = ""):
+        """
+        Embed config which is parsed once
+
+        Args:
+            cfg: embed config from props
+            variables: known variables, using another variable raises TemplateVariableError at once
+            name: name of the embed for the error messages
+        """
+        self.name = name
+        self.color = cfg.get("color")
+        self.url = cfg.get("url")
+        self.title = self.__compile(cfg.get("title"), variables, "title")
+        self.description = self.__compile(cfg.get("description"), variables, "description")
+        self.fields = [(self.__compile(field["name"], variables, f"fields/{i}/name"),
+                        self.__compile(field["value"], variables, f"fields/{i}/value"),
+                        field.get("inline"))
+                       for i, field in enumerate(cfg.get("fields") or [])]
+        self.extras = {key: cfg[key] for key in self.EXTRA_PARTS if cfg.get(key) is not None}
+
+    @property
+    def variables(self) -> frozenset:
+        """Names of variables which are needed for the rendering"""
+        return frozenset().union(*[template.variables for template in self.__templates()])
+
+    def __compile(self, line: str | None, variables: Iterable[str] | None, part: str) -> Template | None:
+        if line is None:
+            return None
+        return Template(line, variables=variables, name=f"{self.name}/{part}")
+
+    def __templates(self) -> List[Template]:
+        templates = [self.title, self.description]
+        for name, value, _ in self.fields:
+            templates += [name, value]
+        return [template for template in templates if template is not None]
+
+    def render(self, dyn_vars: Mapping[str, Any]) -> "SmartEmbed":
+        return SmartEmbed(self, dyn_vars)
+
+    def render_dict(self, dyn_vars: Mapping[str, Any]) -> dict:
+        """Render embed straight to the payload of Discord API"""
+        payload = {"type": "rich"}
+        if self.title is not None:
+            payload["title"] = self.title.render(dyn_vars)
+        if self.description is not None:
+            payload["description"] = self.description.render(dyn_vars)
+        if self.color is not None:
+            payload["color"] = int(self.color)
+        if self.url is not None:
+            payload["url"] = self.url
+        if self.fields:
+            payload["fields"] = [{"inline": bool(inline), "name": name.render(dyn_vars), "value": value.render(dyn_vars)}
+                                 for name, value, inline in self.fields]
+        for key, params in self.extras.items():
+            payload[key] = {param: value for param, value in params.items() if not param.endswith("file")}
+        return payload
 
 
 class SmartEmbed(Embed):
-    def __init__(self, cfg: dict, dyn_vars: Dict[str, str]):
+    EMBED_FUNCS = {
+        "thumbnail": Embed.set_thumbnail,
+        "author": Embed.set_author,
+        "footer": Embed.set_footer,
+        "image": Embed.set_image
+    }
+
+    def __init__(self, cfg: dict | EmbedTemplate, dyn_vars: Mapping[str, Any]):
         self.dyn_vars = dyn_vars
-        embed_funcs = {
-            "thumbnail": super().set_thumbnail,
-            "author": super().set_author,
-            "footer": super().set_footer,
-            "image": super().set_image
-        }
-
-        # create init args and super init
-        init_args = {"color": cfg.get("color"), "url": cfg.get("url")}
-        for arg in ("title", "description"):
-            value = cfg.get(arg)
-            if value is not None:
-                value = value.format(**dyn_vars)
-            init_args[arg] = value
-
-        super().__init__(**init_args)
-
-        # create fields and call init methods
-        if cfg.get("fields") is not None:
-            self.add_fields(cfg["fields"])
-
-        for key in embed_funcs:
-            if cfg.get(key) is None:
-                continue
-            embed_funcs[key](**cfg[key])
+        if isinstance(cfg, EmbedTemplate):
+            # compiled embed only substitutes values
+            init_args = {"color": cfg.color, "url": cfg.url,
+                         "title": cfg.title.render(dyn_vars) if cfg.title is not None else None,
+                         "description": cfg.description.render(dyn_vars) if cfg.description is not None else None}
+            super().__init__(**init_args)
+            for name, value, inline in cfg.fields:
+                super().add_field(name=name.render(dyn_vars), value=value.render(dyn_vars), inline=inline)
+            extras = cfg.extras
+        else:
+            # create init args and super init
+            init_args = {"color": cfg.get("color"), "url": cfg.get("url")}
+            for arg in ("title", "description"):
+                value = cfg.get(arg)
+                if value is not None:
+                    value = value.format(**dyn_vars)
+                init_args[arg] = value
+
+            super().__init__(**init_args)
+
+            # create fields
+            if cfg.get("fields") is not None:
+                self.add_fields(cfg["fields"])
+            extras = {key: cfg[key] for key in EmbedTemplate.EXTRA_PARTS if cfg.get(key) is not None}
+
+        # call init methods
+        for key, params in extras.items():
+            self.EMBED_FUNCS[key](self, **params)
 
     def add_fields(self, embeds: List[dict]):
         for embed in embeds:
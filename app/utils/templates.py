@@ -0,0 +1,88 @@
+from app.factory.errors import TemplateVariableError
+from typing import Any, Iterable, List, Mapping, Tuple
+from string import Formatter
+
+
+_formatter = Formatter()
+
+
+def _field_root(field: str) -> str:  # name of the variable in field like "user.name" or "items[0]"
+    for i, sym in enumerate(field):
+        if sym in ".[":
+            return field[:i]
+    return field
+
+
+class Template:
+    def __init__(self, line: str, variables: Iterable[str] | None = None, name: str = ""):
+        """
+        Line in the str.format style, which is compiled once to the literal parts and fields
+
+        Args:
+            line: template line
+            variables: known variables, using another variable raises TemplateVariableError at once
+            name: name of the template for the error messages
+        """
+        self.line = line
+        self.name = name
+        # (literal, field), field is (root variable, full field, conversion, spec, compiled spec) or None
+        self._parts: List[Tuple[str, tuple | None]] = []
+        variables_in_line = set()
+        for literal, field, spec, conversion in _formatter.parse(line):
+            if field is None:
+                self._parts.append((literal, None))
+                continue
+            root = _field_root(field)
+            if not root or root.isdigit():
+                raise ValueError(f"Template \"{name or line}\" has positional field, only named fields are allowed")
+            variables_in_line.add(root)
+            # spec with nested fields like {value:{width}} is rendered too
+            spec_template = Template(spec, name=name) if spec and "{" in spec else None
+            if spec_template is not None:
+                variables_in_line.update(spec_template.variables)
+            self._parts.append((literal, (root, field if field != root else None, conversion, spec, spec_template)))
+        self._variables = frozenset(variables_in_line)
+        # line without fields is returned as it is
+        self._const = "".join(literal for literal, _ in self._parts) if not self._variables else None
+
+        if variables is not None:
+            unknown = self._variables.difference(variables)
+            if unknown:
+                raise TemplateVariableError(self.name or self.line, unknown)
+
+    @property
+    def variables(self) -> frozenset:
+        """Names of variables which are needed for the rendering"""
+        return self._variables
+
+    def __str__(self):
+        return self.line
+
+    def render(self, dyn_vars: Mapping[str, Any]) -> str:
+        """Put values into the template"""
+        if self._const is not None:
+            return self._const
+        chunks = []
+        try:
+            for literal, field in self._parts:
+                if literal:
+                    chunks.append(literal)
+                if field is None:
+                    continue
+                root, full_field, conversion, spec, spec_template = field
+                # attributes and indexes are resolved like in str.format
+                value = dyn_vars[root] if full_field is None else _formatter.get_field(full_field, (), dyn_vars)[0]
+                if conversion is not None:
+                    value = _formatter.convert_field(value, conversion)
+                if spec_template is not None:
+                    spec = spec_template.render(dyn_vars)
+                chunks.append(value if type(value) is str and not spec else format(value, spec))
+        except KeyError:
+            missing = self._variables.difference(dyn_vars)
+            if not missing:
+                raise
+            raise TemplateVariableError(self.name or self.line, missing)
+        return "".join(chunks)
+
+    def format(self, **dyn_vars: Any) -> str:
+        return self.render(dyn_vars)
@@ -1,11 +1,14 @@
 from json5 import dump as dump5, load as load5
-from app.utils.crypter import Crypter
+from app.utils.crypter import Crypter, get_crypter
 from re import search as shape_search
 from sys import path as sys_path
 from dotenv import dotenv_values
 from json import load, dumps
-from typing import Any, List
+from typing import Any, Dict, List, Tuple, Mapping
+from types import MappingProxyType
+from time import monotonic
 from os.path import exists
+from os import stat, replace
 from pathlib import Path
 
 
@@ -34,9 +37,8 @@ class JsonManager:
             address: file path
             smart_create: create file if it not exists
         """
-        # load config for JsonManager in file json_conf.json
-        with open(launch_path + PATH_CONFIG_JSON, "r") as f:
-            self.json_config = load(f)
+        # get shared config for JsonManager from file json_conf.json
+        self.json_config = JsonRegistry.json_config()
 
         # set path and name file
         if address_type:
@@ -49,18 +51,47 @@ class JsonManager:
         self._fullpath = self._path + self._name
         # create dict which will content all data from file.json
         self._buffer = {}
+        # caches for __getitem__: parsed paths never change, resolved values
+        # are valid only while the generation of the buffer is the same
+        self._generation = 0
+        self._path_cache: Dict[str, Tuple[str, ...]] = {}
+        self._lookup_cache: Dict[str, Tuple[int, Any]] = {}
+        # mtime of the file at the moment of the last loading
+        self._mtime: int | None = None
         if smart_create and not exists(self._path):
             self.write_in_file()
 
-    def __path_items(self, line: str) -> List[str]:  # split path to elements
+    def __path_items(self, line: str) -> Tuple[str, ...]:  # split path to elements
+        path_items = self._path_cache.get(line)
+        if path_items is not None:
+            return path_items
         res_parse = shape_search("<&(.+?)>", line)
         if res_parse:
             separator = res_parse.group(1)
         else:
             separator = self.json_config["def_separator"]
-        path_items = line.split(separator)
+        path_items = tuple(line.split(separator))
+        self._path_cache[line] = path_items
         return path_items
 
+    def _new_generation(self) -> None:  # drop all resolved values after buffer changes
+        self._generation += 1
+        self._lookup_cache.clear()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def fullpath(self) -> str:
+        return self._fullpath
+
+    def _file_mtime(self) -> int | None:
+        try:
+            return stat(self._fullpath).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
     # methods for buffer
     @property
     def buffer(self) -> dict:
@@ -69,19 +100,24 @@ class JsonManager:
     @buffer.setter
     def buffer(self, dictionary: dict) -> None:
         self._buffer = dictionary.copy()
+        self._new_generation()
 
     def __str__(self):
         return dumps(self._buffer)
 
     def __getitem__(self, item) -> Any:  # method for get item from dict by class
         item = str(item)
-        object_output = self._buffer.copy()
+        cached = self._lookup_cache.get(item)
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
+        object_output = self._buffer
         # get separator for pars items and path
         path_items = self.__path_items(item)
         # getting need element
         for path_item in path_items:
             object_output = object_output.get(path_item)
 
+        self._lookup_cache[item] = (self._generation, object_output)
         return object_output
 
     def __setitem__(self, key, value) -> None:  # method for set item from dict by class
@@ -97,6 +133,7 @@ class JsonManager:
             # create empty dict if address is empty
             buffer.setdefault(k, {})
             buffer = buffer[k]
+        self._new_generation()
 
     # group of methods for working with dict buffer without getting them.
     def keys(self):
@@ -112,17 +149,101 @@ class JsonManager:
 
     # write all data from file to buffer
     def load_from_file(self) -> None:
+        self._mtime = self._file_mtime()
         with open(self._fullpath, "r", encoding=self.json_config["encoding"]) as f:
             self._buffer = load(f)
+        self._new_generation()
+
+    def reload_if_changed(self) -> bool:
+        """Load buffer from file only if file was changed after the last loading"""
+        if self._file_mtime() == self._mtime:
+            return False
+        self.load_from_file()
+        return True
 
     # write all data from buffer to file
     def write_in_file(self) -> None:
         Path(self._path).mkdir(parents=True, exist_ok=True)
-        with open(self._fullpath, "w", encoding=self.json_config["encoding"]) as f:
+        # write to temp file and rename it, so readers never see half-written file
+        temp_path = self._fullpath + ".tmp"
+        with open(temp_path, "w", encoding=self.json_config["encoding"]) as f:
             f.write(dumps(self._buffer, indent=self.json_config["indent"]))
+        replace(temp_path, self._fullpath)
+        self._mtime = self._file_mtime()
+
+
+class JsonRegistry:
+    """
+    Process-wide storage of the json_conf.json snapshot and shared JsonManager objects
+
+    The bot, loggers and cogs get the same JsonManager for the same file,
+    so every file is read and parsed only once per process.
+    """
+    _json_config: dict | None = None
+    _json_config_mtime: int | None = None
+    _managers: Dict[str, JsonManager] = {}
+
+    @classmethod
+    def json_config(cls) -> dict:
+        """Shared config for JsonManager (do not edit it)"""
+        if cls._json_config is None:
+            cls.reload_json_config()
+        return cls._json_config
+
+    @classmethod
+    def reload_json_config(cls) -> bool:
+        """Reload json_conf.json if it was changed"""
+        fullpath = launch_path + PATH_CONFIG_JSON
+        mtime = stat(fullpath).st_mtime_ns
+        if cls._json_config is not None and mtime == cls._json_config_mtime:
+            return False
+        with open(fullpath, "r") as f:
+            cls._json_config = load(f)
+        cls._json_config_mtime = mtime
+        return True
+
+    @classmethod
+    def get(cls, address: str,
+            address_type: str = AddressType.FILE,
+            manager_class: type = JsonManager) -> JsonManager:
+        """
+        Get shared and loaded manager for the file
+
+        Args:
+            address: file path
+            address_type: use class AddressType for setting this parameter
+            manager_class: class of manager, which will be created for the first call
+        """
+        key = cls._key(address, address_type)
+        manager = cls._managers.get(key)
+        if manager is None:
+            manager = manager_class(address, address_type=address_type)
+            manager.load_from_file()
+            cls._managers[key] = manager
+        return manager
+
+    @classmethod
+    def reload(cls, address: str, address_type: str = AddressType.FILE) -> bool:
+        """Reload shared manager if its file was changed"""
+        manager = cls._managers.get(cls._key(address, address_type))
+        if manager is None:
+            return False
+        return manager.reload_if_changed()
+
+    @classmethod
+    def reload_all(cls) -> List[JsonManager]:
+        """Reload all changed files and return managers which were reloaded"""
+        return [manager for manager in list(cls._managers.values()) if manager.reload_if_changed()]
+
+    @staticmethod
+    def _key(address: str, address_type: str) -> str:
+        return f"{address_type}:{address}"
 
 
 class JsonManagerWithCrypt(JsonManager):
+    # keys from env files, env file is read once per process
+    _crypt_keys: Dict[str, bytes] = {}
+
     def __init__(self, address: str,
                  address_type: str = AddressType.CFILE,
                  crypt_key: bytes | None = None,
@@ -141,13 +262,17 @@ class JsonManagerWithCrypt(JsonManager):
         if smart_create and not exists(self._path + self._name):
             self.write_in_file()
 
-    def __crypter_init(self, crypt_key: bytes | None) -> Crypter:  # method for creating crypter
+    def __crypter_init(self, crypt_key: bytes | None) -> Crypter:  # method for getting shared crypter
         if not crypt_key:
-            env_vars = dotenv_values(self.json_config["env_with_crypt_key"])
-            str_crypt_key = env_vars["DEFAULT_CRYPT_KEY"]
-            crypt_key = str.encode(str_crypt_key, encoding="utf-8")
-            del env_vars, str_crypt_key
-        crypter = Crypter(crypt_key=crypt_key)
+            env_path = self.json_config["env_with_crypt_key"]
+            crypt_key = self._crypt_keys.get(env_path)
+            if crypt_key is None:
+                env_vars = dotenv_values(env_path)
+                str_crypt_key = env_vars["DEFAULT_CRYPT_KEY"]
+                crypt_key = str.encode(str_crypt_key, encoding="utf-8")
+                self._crypt_keys[env_path] = crypt_key
+                del env_vars, str_crypt_key
+        crypter = get_crypter(crypt_key)
         del crypt_key
         return crypter
 
@@ -157,12 +282,74 @@ class JsonManagerWithCrypt(JsonManager):
         with open(self._fullpath, "wb") as f:
             dict_as_encrypt_bytes = self._crypter.dict_encrypt(self._buffer)
             f.write(dict_as_encrypt_bytes)
+        self._mtime = self._file_mtime()
 
     def load(self) -> None:
         """Load buffer from file"""
+        self._mtime = self._file_mtime()
         with open(self._fullpath, "rb") as f:
             encrypt_dict_as_bytes = f.read()
             self._buffer = self._crypter.dict_decrypt(encrypt_dict_as_bytes)
+        self._new_generation()
+
+    # encrypted file is never read or written as plain json
+    load_from_file = load
+    write_in_file = write
+
+
+def _freeze(obj: Any) -> Any:  # convert dicts and lists to read-only objects
+    if isinstance(obj, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(value) for value in obj)
+    return obj
+
+
+class SecretsStore:
+    """
+    Process-wide storage of decrypted .crptjson files
+
+    Every file is decrypted once and given out as a read-only view.
+    File is decrypted again only if its mtime was changed,
+    mtime is checked not often than once per check_interval seconds.
+    """
+    check_interval: float = 1.0
+    # key -> [manager, read-only view, time of the last mtime check]
+    _entries: Dict[str, list] = {}
+
+    @classmethod
+    def get(cls, address: str,
+            address_type: str = AddressType.CFILE,
+            crypt_key: bytes | None = None) -> Mapping[str, Any]:
+        """
+        Get read-only view of decrypted file
+
+        Args:
+            address: file path
+            address_type: use class AddressType for setting this parameter
+            crypt_key: symmetric key
+        """
+        key = f"{address_type}:{address}"
+        entry = cls._entries.get(key)
+        now = monotonic()
+        if entry is None:
+            manager = JsonManagerWithCrypt(address, address_type=address_type, crypt_key=crypt_key)
+            manager.load()
+            entry = [manager, _freeze(manager.buffer), now]
+            cls._entries[key] = entry
+        elif now - entry[2] >= cls.check_interval:
+            if entry[0].reload_if_changed():
+                entry[1] = _freeze(entry[0].buffer)
+            entry[2] = now
+        return entry[1]
+
+    @classmethod
+    def invalidate(cls, address: str | None = None, address_type: str = AddressType.CFILE) -> None:
+        """Forget decrypted file (or all files), it will be decrypted with the next get"""
+        if address is None:
+            cls._entries.clear()
+        else:
+            cls._entries.pop(f"{address_type}:{address}", None)
 
 
 class JsonManager5(JsonManager):
@@ -174,6 +361,7 @@ class JsonManager5(JsonManager):
     def load(self) -> None:
         with open(self._path, "r", encoding=self.json_config["encoding"]) as f:
             self._buffer = load5(f)
+        self._new_generation()
 
     # write all data from buffer to file
     def write(self) -> None:
@@ -1,23 +1,208 @@
 from aiomcrcon import Client, RCONConnectionError, IncorrectPasswordError
-from app.utils.ujson import JsonManagerWithCrypt, AddressType
-from typing import List
+from app.utils.ujson import SecretsStore
+from app.factory.errors import RconServerNameError
+from contextlib import asynccontextmanager
+from typing import List, Tuple, Dict, Set, AsyncIterator, Iterable
+from time import monotonic
+import asyncio
+
+
+class RconPool:
+    """
+    Pool of authenticated rcon connections to one server
+    """
+    # errors of the code in "async with connection()" which are raised before anything is sent,
+    # connection stays usable after them (for example, formatting of command without var)
+    command_errors: Tuple[type, ...] = (KeyError, IndexError)
+
+    def __init__(self, host: str, port: int, password: str,
+                 max_size: int = 4,
+                 idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0,
+                 health_check_cmd: str = "list",
+                 connect_timeout: float = 2.0):
+        """
+            host - address minecraft server
+            port - port for rcon socket (see server.properties)
+            password - password for rcon (see server.properties)
+            max_size - max count of connections which are open at the same time
+            idle_timeout - seconds after which unused connection is closed
+            health_check_interval - connection which was unused longer is checked before using
+            health_check_cmd - harmless command for the checking connection
+            connect_timeout - timeout for connection and login
+        """
+        self._connect_data = {
+            "host": host,
+            "port": port,
+            "password": password
+        }
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_cmd = health_check_cmd
+        self.connect_timeout = connect_timeout
+        # free connections with time of the last using, the newest is the last
+        self._idle: List[Tuple[Client, float]] = []
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._size = 0
+        self._closed = False
+        # task which closes free connections after idle_timeout, it works while pool has them
+        self._evict_task: asyncio.Task | None = None
+
+    @property
+    def connect_data(self) -> dict:
+        return self._connect_data.copy()
+
+    @property
+    def size(self) -> int:  # count of open connections
+        return self._size
+
+    @property
+    def idle(self) -> int:  # count of free open connections
+        return len(self._idle)
+
+    async def _open_client(self) -> Client:
+        client = Client(**self._connect_data)
+        await client.connect(timeout=self.connect_timeout)
+        self._size += 1
+        return client
+
+    async def _close_client(self, client: Client) -> None:
+        self._size -= 1
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+    async def _is_alive(self, client: Client) -> bool:
+        try:
+            await client.send_cmd(self.health_check_cmd, timeout=self.connect_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _evict_idle(self) -> None:  # close connections which were unused too long
+        expired_time = monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < expired_time:
+            client, _ = self._idle.pop(0)
+            await self._close_client(client)
+
+    async def _evict_loop(self) -> None:
+        # pool which is not used anymore must not keep sockets open
+        while self._idle and not self._closed:
+            await asyncio.sleep(max(self._idle[0][1] + self.idle_timeout - monotonic(), 0.0))
+            await self._evict_idle()
+
+    def _start_evict_task(self) -> None:
+        if self._evict_task is None or self._evict_task.done():
+            self._evict_task = asyncio.get_running_loop().create_task(self._evict_loop())
+
+    async def acquire(self) -> Client:
+        """Take free connection or open a new one"""
+        await self._semaphore.acquire()
+        try:
+            await self._evict_idle()
+            while self._idle:
+                client, last_used = self._idle.pop()
+                if monotonic() - last_used < self.health_check_interval or await self._is_alive(client):
+                    return client
+                await self._close_client(client)
+            return await self._open_client()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, client: Client, broken: bool = False) -> None:
+        """Return connection to the pool, broken connection is closed"""
+        try:
+            if broken or self._closed:
+                await self._close_client(client)
+            else:
+                self._idle.append((client, monotonic()))
+                self._start_evict_task()
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[Client]:
+        client = await self.acquire()
+        broken = False
+        try:
+            yield client
+        except self.command_errors:
+            raise
+        except BaseException:
+            # socket could be closed by server or answer can still come to the connection,
+            # so next caller will get a new one
+            broken = True
+            raise
+        finally:
+            await self.release(client, broken=broken)
+
+    async def close(self) -> None:
+        """Close all free connections, connections in use are closed on release"""
+        self._closed = True
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+        while self._idle:
+            client, _ = self._idle.pop()
+            await self._close_client(client)
+
+
+# pools by server name from file .rcon_servers.crptjson
+_pools: Dict[str, RconPool] = {}
+# closing of replaced pools, references are kept until tasks are done
+_closing_tasks: Set[asyncio.Task] = set()
+
+
+def get_rcon_pool(name_server: str, connect_data: dict, **pool_params) -> RconPool:
+    """Get shared pool for the server, pool is created again if connection data were changed"""
+    pool = _pools.get(name_server)
+    if pool is None or pool.connect_data != connect_data:
+        if pool is not None:
+            _close_replaced_pool(pool)
+        pool = RconPool(**connect_data, **pool_params)
+        _pools[name_server] = pool
+    return pool
+
+
+def _close_replaced_pool(pool: RconPool) -> None:
+    # connections in use are closed on release, free ones are closed now
+    pool._closed = True
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # without running loop idle connections belong to the stopped loop
+        return
+    task = loop.create_task(pool.close())
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+async def close_rcon_pools() -> None:
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
 
 
 class RawRconManager:
     """
     Class for working with rcon connections on low lvl
     """
-    def __init__(self, host: str, port: int, password: str):
+    def __init__(self, host: str, port: int, password: str, pool: RconPool | None = None):
         """
             host - address minecraft server
             port - port for rcon socket (see server.properties)
             password - password for rcon (see server.properties)
+            pool - pool of connections, without it every call opens a new connection
         """
         self.__connect_data = {
             "host": host,
             "port": port,
             "password": password
         }
+        self._pool = pool
 
     async def test_connect(self) -> (int, str):  # func for test connection
         try:
@@ -36,8 +221,11 @@ class RawRconManager:
     @staticmethod
     def rcon_connect(func):
         async def wrapper(self, *args, **kwargs):
+            if self._pool is not None:
+                async with self._pool.connection() as client:
+                    return await func(self, client, *args, **kwargs)
             async with Client(**self.__connect_data) as client:
-                return await func(client, *args, **kwargs)
+                return await func(self, client, *args, **kwargs)
         return wrapper
 
 
@@ -45,14 +233,21 @@ class RconManager(RawRconManager):
     """
     Class for working with rcon connection on high lvl
     """
-    def __init__(self, name_server: str):
+    def __init__(self, name_server: str, pooled: bool = True):
         """
         name_server - server name from file .rcon_servers.crptjson
+        pooled - use shared pool of connections to the server
+                 (settings of pool can be set in key "pool" of the server data)
         """
-        jsm = JsonManagerWithCrypt(AddressType.CFILE, ".rcon_servers.crptjson")
-        jsm.load_from_file()
-        server_conn_data = jsm[f"servers/{name_server}"]
-        super().__init__(**server_conn_data)
+        # decrypted once per process, next managers only take data from dict
+        server_conn_data = SecretsStore.get(".rcon_servers.crptjson").get(name_server)
+        if server_conn_data is None:
+            raise RconServerNameError(name_server)
+        connect_data = {key: server_conn_data[key] for key in ("host", "port", "password")}
+        pool = None
+        if pooled:
+            pool = get_rcon_pool(name_server, connect_data, **server_conn_data.get("pool", {}))
+        super().__init__(**connect_data, pool=pool)
 
     # method for executing commands on the server
     @RawRconManager.rcon_connect
@@ -64,3 +259,96 @@ class RconManager(RawRconManager):
             texts.append(text)
             codes.append(code)
         return texts, codes
+
+
+class RconResult:
+    def __init__(self, name_server: str, texts: list, codes: list,
+                 error: Exception | None, elapsed: float):
+        """
+        Result of the commands on one server
+
+        Args:
+            name_server: server name from file .rcon_servers.crptjson
+            texts: answers of the server
+            codes: codes of the answers
+            error: exception raised during connection or commands executing
+            elapsed: seconds from the start of the executing on this server
+        """
+        self.name_server = name_server
+        self.texts = texts
+        self.codes = codes
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class RconBroadcast:
+    def __init__(self, servers: Iterable[str], commands: List[str],
+                 dyn_vars: dict | None = None,
+                 concurrency: int = 16,
+                 timeout: float = 10.0,
+                 pooled: bool = True):
+        """
+        Run the same commands on many servers at the same time
+
+        Results are given as they complete:
+            async for result in RconBroadcast(servers, commands): ...
+
+        Args:
+            servers: server names from file .rcon_servers.crptjson
+            commands: commands for every server
+            dyn_vars: vars for the formatting commands
+            concurrency: max count of servers which execute commands at the same time
+            timeout: max seconds for one server
+            pooled: use shared pools of connections
+        """
+        self.servers = list(servers)
+        self.commands = commands
+        self.dyn_vars = dyn_vars or {}
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.pooled = pooled
+        # aggregate stats, are filled during the iteration
+        self.elapsed = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def __aiter__(self) -> AsyncIterator[RconResult]:
+        return self.run()
+
+    async def _run_one(self, name_server: str, semaphore: asyncio.Semaphore) -> RconResult:
+        async with semaphore:
+            start_time = monotonic()
+            try:
+                manager = RconManager(name_server, pooled=self.pooled)
+                texts, codes = await asyncio.wait_for(manager.cmd(self.commands, self.dyn_vars), self.timeout)
+                return RconResult(name_server, texts, codes, None, monotonic() - start_time)
+            except Exception as e:
+                return RconResult(name_server, [], [], e, monotonic() - start_time)
+
+    async def run(self) -> AsyncIterator[RconResult]:
+        """Execute commands and yield results in the order of completion"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start_time = monotonic()
+        tasks = [asyncio.ensure_future(self._run_one(name_server, semaphore)) for name_server in self.servers]
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                if result.ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.elapsed = monotonic() - start_time
+                yield result
+        finally:
+            # iteration was stopped before the end
+            for task in tasks:
+                task.cancel()
+            self.elapsed = monotonic() - start_time
+
+    async def gather(self) -> Dict[str, RconResult]:
+        """Execute commands and return results by server names"""
+        return {result.name_server: result async for result in self.run()}
@@ -0,0 +1,80 @@
+from app.utils.ujson import JsonManager
+from app.utils.logger import Logger
+from typing import Callable, Dict, List
+import asyncio
+
+
+class ConfigWatcher:
+    def __init__(self, log: Logger, interval: float = 0.5):
+        """
+        Poll mtimes of json files and reload changed files into the live JsonManager objects
+
+        File is parsed before the buffer is replaced, so readers see either old or new data.
+        Broken file (for example, editor is still writing it) is skipped until the next change.
+
+        Args:
+            log: logger for reload notes
+            interval: seconds between the checks
+        """
+        self.log = log
+        self.interval = interval
+        self._managers: Dict[int, JsonManager] = {}
+        # id of manager > functions which are called after the reloading
+        self._callbacks: Dict[int, List[Callable[[JsonManager], None]]] = {}
+        self._task: asyncio.Task | None = None
+
+    def watch(self, manager: JsonManager, callback: Callable[[JsonManager], None] | None = None) -> None:
+        """
+        Start watching file of the manager
+
+        Args:
+            manager: manager, which buffer will be reloaded
+            callback: function which is called with manager after the reloading
+        """
+        key = id(manager)
+        self._managers[key] = manager
+        callbacks = self._callbacks.setdefault(key, [])
+        if callback is not None and callback not in callbacks:
+            callbacks.append(callback)
+
+    def unwatch_callback(self, manager: JsonManager, callback: Callable[[JsonManager], None]) -> None:
+        callbacks = self._callbacks.get(id(manager), [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def check(self) -> List[JsonManager]:
+        """Reload changed files and return managers which were reloaded"""
+        reloaded = []
+        for key, manager in list(self._managers.items()):
+            try:
+                changed = manager.reload_if_changed()
+            except (OSError, ValueError) as error:
+                self.log.warn("Config %s is not reloaded: %s", manager.fullpath, error)
+                # mtime is already remembered, so broken version of file is not parsed again
+                continue
+            if not changed:
+                continue
+            self.log.info("Config %s is reloaded", manager.fullpath)
+            reloaded.append(manager)
+            for callback in list(self._callbacks.get(key, [])):
+                try:
+                    callback(manager)
+                except Exception as error:
+                    self.log.error("Error in reload callback of %s: %s", manager.fullpath, error)
+        return reloaded
+
+    async def run(self) -> None:
+        while True:
+            self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> asyncio.Task:
+        """Start polling in the task of the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
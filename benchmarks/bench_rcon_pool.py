@@ -0,0 +1,54 @@
+"""
+Commands per second of RCON with and without pooling, against the local fake server
+
+Run from the root of project: python -m benchmarks.bench_rcon_pool [commands] [concurrency]
+"""
+from aiomcrcon import Client
+from app.utils.urcon import RconPool
+from tests.fake_rcon import FakeRconServer
+from time import perf_counter
+import asyncio
+import sys
+
+
+async def without_pool(server: FakeRconServer, commands: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i: int) -> None:
+        async with semaphore:
+            async with Client(**server.connect_data) as client:
+                await client.send_cmd(f"say {i}")
+
+    start_time = perf_counter()
+    await asyncio.gather(*[send(i) for i in range(commands)])
+    return commands / (perf_counter() - start_time)
+
+
+async def with_pool(server: FakeRconServer, commands: int, concurrency: int) -> float:
+    pool = RconPool(**server.connect_data, max_size=concurrency)
+
+    async def send(i: int) -> None:
+        async with pool.connection() as client:
+            await client.send_cmd(f"say {i}")
+
+    start_time = perf_counter()
+    await asyncio.gather(*[send(i) for i in range(commands)])
+    result = commands / (perf_counter() - start_time)
+    await pool.close()
+    return result
+
+
+async def main(commands: int, concurrency: int) -> None:
+    server = await FakeRconServer().start()
+    try:
+        for name, bench in (("without pool", without_pool), ("with pool", with_pool)):
+            logins = server.logins
+            rate = await bench(server, commands, concurrency)
+            print(f"{name:>12}: {rate:10.0f} commands/s, logins: {server.logins - logins}")
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 4))
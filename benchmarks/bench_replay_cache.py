@@ -0,0 +1,44 @@
+"""
+Memory and speed of ReplayCache of one session under the steady rate of messages
+
+Time is simulated, so the full window of MAX_MESSAGE_LIFE is passed in seconds.
+Run from the root of project: python -m benchmarks.bench_replay_cache [rate] [seconds]
+"""
+from app.cogs.WebAPI.Models import ReplayCache, MAX_MESSAGE_LIFE
+from time import perf_counter, time
+import tracemalloc
+import sys
+
+
+def fill(cache: ReplayCache, rate: int, seconds: int, start: float) -> int:
+    """Add rate umids every simulated second, returns the max count of remembered umids"""
+    max_len = 0
+    for second in range(seconds):
+        now = start + second
+        for i in range(rate):
+            cache.add(f"{second:08d}-{i:08d}", now + MAX_MESSAGE_LIFE, now=now)
+        max_len = max(max_len, len(cache))
+    return max_len
+
+
+def main(rate: int, seconds: int) -> None:
+    start = time()
+    cache = ReplayCache()
+    start_time = perf_counter()
+    fill(cache, rate, seconds, start)
+    elapsed = perf_counter() - start_time
+    print(f"speed: {rate * seconds / elapsed:.0f} adds/s")
+
+    tracemalloc.start()
+    cache = ReplayCache()
+    max_len = fill(cache, rate, seconds, start)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"rate: {rate} msg/s, simulated: {seconds} s, exp window: {MAX_MESSAGE_LIFE} s")
+    print(f"max remembered umids: {max_len}, buckets at the end: {cache.buckets}")
+    print(f"memory at the end: {current / 2 ** 20:.1f} MiB, peak: {peak / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2 * MAX_MESSAGE_LIFE)
@@ -0,0 +1,86 @@
+from typing import List
+import asyncio
+import struct
+
+
+# types of packets of the source RCON protocol
+LOGIN = 3
+COMMAND = 2
+RESPONSE = 0
+
+
+class FakeRconServer:
+    def __init__(self, password: str = "secret", delay: float = 0.0):
+        """
+        Local RCON server for tests and benchmarks, it answers every command with "echo <command>"
+
+        Args:
+            password: password for the login
+            delay: seconds before the answer to command, like work of the real server
+        """
+        self.password = password
+        self.delay = delay
+        self.host = "127.0.0.1"
+        self.port = 0
+        self.logins = 0
+        self.commands = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._writers: List[asyncio.StreamWriter] = []
+
+    @property
+    def connect_data(self) -> dict:
+        return {"host": self.host, "port": self.port, "password": self.password}
+
+    @property
+    def open_connections(self) -> int:
+        return len([writer for writer in self._writers if not writer.is_closing()])
+
+    async def start(self) -> "FakeRconServer":
+        self._server = await asyncio.start_server(self._handle_client, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def drop_connections(self) -> None:
+        """Close all connections like the restarted minecraft server"""
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    async def close(self) -> None:
+        self.drop_connections()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @staticmethod
+    def _packet(request_id: int, packet_type: int, body: str) -> bytes:
+        data = struct.pack("<ii", request_id, packet_type) + body.encode() + b"\x00\x00"
+        return struct.pack("<i", len(data)) + data
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.append(writer)
+        authorized = False
+        try:
+            while True:
+                (length,) = struct.unpack("<i", await reader.readexactly(4))
+                data = await reader.readexactly(length)
+                request_id, packet_type = struct.unpack("<ii", data[:8])
+                body = data[8:-2].decode()
+                if packet_type == LOGIN:
+                    authorized = body == self.password
+                    self.logins += authorized
+                    writer.write(self._packet(request_id if authorized else -1, COMMAND, ""))
+                elif packet_type == COMMAND and authorized:
+                    self.commands += 1
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    writer.write(self._packet(request_id, RESPONSE, f"echo {body}"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # server is stopped with the event loop
+            pass
+        finally:
+            writer.close()
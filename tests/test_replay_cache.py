@@ -0,0 +1,61 @@
+from app.cogs.WebAPI.Models import ReplayCache, MAX_MESSAGE_LIFE, REPLAY_BUCKET_WIDTH
+
+
+START = 1_000_000.0
+
+
+def new_cache() -> ReplayCache:
+    cache = ReplayCache()
+    cache._oldest = int(START) // cache.bucket_width
+    return cache
+
+
+def test_replay_is_rejected():
+    cache = new_cache()
+    assert cache.add("umid-1", START + 60, now=START)
+    assert not cache.add("umid-1", START + 60, now=START + 1)
+    # the same umid with another exp is still a replay
+    assert not cache.add("umid-1", START + 200, now=START + 2)
+    assert cache.add("umid-2", START + 60, now=START + 2)
+    assert len(cache) == 2
+
+
+def test_umid_is_forgotten_after_exp():
+    cache = new_cache()
+    assert cache.add("umid-1", START + 10, now=START)
+    # bucket is dropped not later than bucket_width after exp
+    assert not cache.add("umid-1", START + 10, now=START + 10 - REPLAY_BUCKET_WIDTH)
+    assert cache.add("umid-1", START + 100, now=START + 10 + REPLAY_BUCKET_WIDTH)
+    assert len(cache) == 1
+
+
+def test_expired_buckets_are_dropped_whole():
+    cache = new_cache()
+    for i in range(100):
+        cache.add(f"umid-{i}", START + i, now=START)
+    assert cache.buckets == 100 // REPLAY_BUCKET_WIDTH + 1
+    cache.add("last", START + 1000, now=START + 500)
+    assert len(cache) == 1
+    assert cache.buckets == 1
+
+
+def test_long_pause_drops_all_buckets():
+    cache = new_cache()
+    for i in range(50):
+        cache.add(f"umid-{i}", START + MAX_MESSAGE_LIFE, now=START)
+    cache.add("after pause", START + 10 ** 7 + 60, now=START + 10 ** 7)
+    assert len(cache) == 1
+
+
+def test_memory_is_bounded_by_rate_and_message_life():
+    cache = new_cache()
+    rate = 200
+    max_len = 0
+    for second in range(3 * MAX_MESSAGE_LIFE):
+        now = START + second
+        for i in range(rate):
+            assert cache.add(f"{second}-{i}", now + MAX_MESSAGE_LIFE, now=now)
+        max_len = max(max_len, len(cache))
+    # only umids with exp in the last MAX_MESSAGE_LIFE + one bucket are kept
+    assert max_len <= rate * (MAX_MESSAGE_LIFE + REPLAY_BUCKET_WIDTH)
+    assert cache.buckets <= MAX_MESSAGE_LIFE // REPLAY_BUCKET_WIDTH + 2
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiomcrcon")
+
+from app.utils.urcon import RconPool
+from tests.fake_rcon import FakeRconServer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _with_server(test, **pool_params):
+    server = await FakeRconServer().start()
+    pool = RconPool(**server.connect_data, **pool_params)
+    try:
+        await test(server, pool)
+    finally:
+        await pool.close()
+        await server.close()
+
+
+async def _send(pool: RconPool, command: str) -> str:
+    async with pool.connection() as client:
+        text, _ = await client.send_cmd(command)
+        return text
+
+
+def test_connection_is_reused():
+    async def test(server, pool):
+        for i in range(20):
+            assert await _send(pool, f"say {i}") == f"echo say {i}"
+        assert server.logins == 1
+        assert pool.size == 1
+
+    run(_with_server(test))
+
+
+def test_concurrent_callers_share_bounded_pool():
+    async def test(server, pool):
+        texts = await asyncio.gather(*[_send(pool, f"cmd {i}") for i in range(50)])
+        assert texts == [f"echo cmd {i}" for i in range(50)]
+        assert server.logins <= 4
+        assert pool.size <= 4
+
+    run(_with_server(test, max_size=4))
+
+
+def test_reconnect_after_server_restart():
+    async def test(server, pool):
+        assert await _send(pool, "list") == "echo list"
+        server.drop_connections()
+        await asyncio.sleep(0.05)
+        # dead client is found by the health check and replaced by a new one
+        assert await _send(pool, "list") == "echo list"
+        assert server.logins == 2
+        assert pool.size == 1
+
+    run(_with_server(test, health_check_interval=0))
+
+
+def test_broken_client_is_not_returned_to_pool():
+    async def test(server, pool):
+        assert await _send(pool, "list") == "echo list"
+        server.drop_connections()
+        await asyncio.sleep(0.05)
+        with pytest.raises(Exception):
+            await _send(pool, "list")
+        assert pool.size == 0
+        assert await _send(pool, "list") == "echo list"
+
+    # without health check the dead client is given to the caller once
+    run(_with_server(test, health_check_interval=3600))
+
+
+def test_command_error_keeps_client():
+    async def test(server, pool):
+        await _send(pool, "list")
+        with pytest.raises(KeyError):
+            async with pool.connection():
+                raise KeyError("var")
+        assert pool.idle == 1
+        await _send(pool, "list")
+        assert server.logins == 1
+
+    run(_with_server(test))
+
+
+def test_idle_connections_are_evicted_without_using_pool():
+    async def test(server, pool):
+        await _send(pool, "list")
+        assert server.open_connections == 1
+        await asyncio.sleep(0.3)
+        assert pool.size == 0
+        assert server.open_connections == 0
+
+    run(_with_server(test, idle_timeout=0.1))